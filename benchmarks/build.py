@@ -0,0 +1,161 @@
+# nisshi - Benchmarks - Build
+
+"""Benchmark building a synthetic site.
+
+It times :meth:`nisshi.Manager.build_all` in these cases: cold, warm (no changes), after one page was touched and after one layout was touched.
+It also times rebuilding one page with :meth:`nisshi.Manager.build` as hot reload does, and fails if the page was not built.
+It also times :meth:`nisshi.Manager.clean` and loading and saving the cache.
+The result is written as JSON so that it can be compared over time.
+
+Usage: ``python benchmarks/build.py --pages 1000 --repeat 3 --output result.json``"""
+
+from __future__ import annotations
+
+from typing import Any
+from collections.abc import Callable
+
+from argparse import ArgumentParser
+from dataclasses import asdict
+from statistics import mean, median
+from tempfile import mkdtemp
+from time import perf_counter, time
+from pathlib import PurePath
+import platform
+import sys
+
+from os import chdir, utime, remove
+from os.path import abspath, dirname, exists, join
+from shutil import rmtree
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from generate import SiteParameters, generate_site, page_path, add_arguments
+
+
+def _touch(path: str) -> None:
+    # 確実に更新されたことになるように、未来の日付にする。
+    future = time() + 10
+    utime(path, (future, future))
+
+
+def _summary(runs: list[float]) -> dict[str, Any]:
+    return {"min": min(runs), "mean": mean(runs), "median": median(runs), "runs": runs}
+
+
+def run(
+    parameters: SiteParameters, repeat: int, workers: int,
+    caches_backend: str = "json", async_build: bool = False
+) -> dict[str, Any]:
+    """Run the benchmark.
+    The current working directory is changed to the folder of the generated site.
+
+    Args:
+        parameters: The parameters of the site.
+        repeat: The number of times to repeat each case.
+        workers: The value of :attr:`nisshi.Config.workers`.
+        caches_backend: The value of :attr:`nisshi.Config.caches_backend`.
+        async_build: The value of :attr:`nisshi.Config.async_build`.
+            The layouts then use ``await``, so it also checks that pages are rendered asynchronously."""
+    root = mkdtemp(prefix="nisshi-benchmark-")
+    generate_site(root, parameters, async_build)
+    chdir(root)
+    # `nisshi.config.CURRENT`がサイトのフォルダになるように、移動してからインポートする。
+    from nisshi import __version__, Manager, Config, Caches
+    from nisshi.caches import SQLiteCaches
+    caches_cls = SQLiteCaches if caches_backend == "sqlite" else Caches
+
+    def new_manager() -> Manager:
+        config = Config.from_file("nisshi.toml")
+        config.workers = workers
+        config.caches_backend = caches_backend
+        return Manager(config)
+
+    results: dict[str, list[float]] = {}
+    def measure(name: str, function: Callable[[], Any], prepare: Callable[[], Any] = lambda: None) -> None:
+        for _ in range(repeat):
+            prepare()
+            start = perf_counter()
+            function()
+            results.setdefault(name, []).append(perf_counter() - start)
+
+    def reset() -> None:
+        if exists("outputs"):
+            rmtree("outputs")
+        for path in (".nisshi_caches.json", ".nisshi_caches.sqlite3"):
+            if exists(path):
+                remove(path)
+
+    try:
+        measure("build_all_cold", lambda: new_manager().build_all(), reset)
+        measure("build_all_warm", lambda: new_manager().build_all())
+        pages = iter(range(repeat))
+        measure(
+            "build_all_touch_page", lambda: new_manager().build_all(),
+            lambda: _touch(page_path(parameters, next(pages) % parameters.pages))
+        )
+        measure(
+            "build_all_touch_layout", lambda: new_manager().build_all(),
+            lambda: _touch(join("layouts", "layout.html"))
+        )
+
+        manager = new_manager()
+        def build_page() -> None:
+            path = page_path(parameters, next(pages) % parameters.pages)
+            manager.build(PurePath(path), True)
+            # 失敗したページの出力は消されるので、出力があるかで確かめる。
+            output = join("outputs", *PurePath(path).with_suffix(".html").parts[1:])
+            if not exists(output):
+                raise RuntimeError(f"{path} was not built by Manager.build.")
+        pages = iter(range(repeat))
+        measure("build_page", build_page)
+
+        def prepare_clean() -> None:
+            manager._last_manifest = dict(manager.caches.manifest)
+            manager._recorded = set(manager.caches.manifest)
+        measure("clean", manager.clean, prepare_clean)
+        manager.config.full_clean = True
+        measure("clean_full_scan", manager.clean)
+
+        measure("caches_load", lambda: caches_cls.from_file(manager.config.caches_file))
+        measure("caches_save", lambda: manager.caches.save(manager.config.caches_file))
+    finally:
+        chdir("/")
+        rmtree(root, ignore_errors=True)
+
+    return {
+        "nisshi": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": asdict(parameters) | {
+            "repeat": repeat, "workers": workers, "caches_backend": caches_backend,
+            "async_build": async_build
+        },
+        "results": {name: _summary(runs) for name, runs in results.items()}
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark building a synthetic site.")
+    add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3, help="The number of times to repeat each case.")
+    parser.add_argument("--workers", type=int, default=1, help="The number of worker processes.")
+    parser.add_argument(
+        "--caches-backend", default="json", choices=("json", "sqlite"),
+        help="The way to store the cache. (Default: json)"
+    )
+    parser.add_argument("--async-build", action="store_true", help="Enable async_build and use await in the layouts.")
+    parser.add_argument("--output", default=None, help="The path to the JSON file. (Default: stdout)")
+    args = vars(parser.parse_args())
+    repeat, workers, output = args.pop("repeat"), args.pop("workers"), args.pop("output")
+    caches_backend, async_build = args.pop("caches_backend"), args.pop("async_build")
+
+    from json import dumps
+    result = dumps(run(
+        SiteParameters(**args), repeat, workers, caches_backend, async_build
+    ), indent=2)
+    if output is None:
+        print(result)
+    else:
+        with open(output, "w") as f:
+            f.write(result)
@@ -0,0 +1,75 @@
+# nisshi - Benchmarks - Context
+
+"""Benchmark making and accessing :class:`nisshi.Context` and :class:`nisshi.common.FastContext`.
+
+It times these operations for a class like :class:`nisshi.PageContext` made on each of them:
+construction, reading a default value, reading a key which is not a class attribute, writing a value and calling a method.
+
+Usage: ``python benchmarks/context.py --number 1000000``"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from argparse import ArgumentParser
+from timeit import repeat
+from os.path import abspath, dirname
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from nisshi.common import Context, FastContext
+
+
+class SlowPageContext(Context):
+    title: str = ""
+    description: str = ""
+    head: str = ""
+
+
+class FastPageContext(FastContext):
+    title: str = ""
+    description: str = ""
+    head: str = ""
+
+
+CASES = {
+    "construction": "cls()",
+    "read default": "ctx.title",
+    "read key": "ctx.extra",
+    "write": "ctx.title = 'nisshi'",
+    "method call": "ctx.get('title')"
+}
+
+
+def run(number: int, times: int = 5) -> dict[str, dict[str, Any]]:
+    """Run the benchmark.
+
+    Args:
+        number: The number of times to run each operation in one measurement.
+        times: The number of measurements. The best one is used."""
+    results: dict[str, dict[str, Any]] = {}
+    for name, statement in CASES.items():
+        result = results[name] = {}
+        for cls in (SlowPageContext, FastPageContext):
+            ctx = cls()
+            ctx.extra = 1
+            best = min(repeat(
+                statement, number=number, repeat=times,
+                globals={"cls": cls, "ctx": ctx}
+            ))
+            result[cls.__bases__[0].__name__] = best / number * 1e9
+        result["speedup"] = result["Context"] / result["FastContext"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark Context and FastContext.")
+    parser.add_argument("--number", type=int, default=200000, help="The number of times to run each operation.")
+    args = parser.parse_args()
+
+    print("{:<14}{:>14}{:>14}{:>10}".format("operation", "Context (ns)", "Fast (ns)", "speedup"))
+    for name, result in run(args.number).items():
+        print("{:<14}{:>14.1f}{:>14.1f}{:>9.1f}x".format(
+            name, result["Context"], result["FastContext"], result["speedup"]
+        ))
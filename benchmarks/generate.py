@@ -0,0 +1,140 @@
+# nisshi - Benchmarks - Site Generator
+
+"""Generate a synthetic site for benchmarks.
+
+Usage: ``python benchmarks/generate.py DIRECTORY --pages 1000``"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, asdict
+from random import Random
+
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import join, dirname
+
+
+__all__ = ("SiteParameters", "generate_site", "page_path", "add_arguments")
+
+
+WORDS = (
+    "nisshi", "static", "site", "generator", "markdown", "layout", "template",
+    "page", "build", "cache", "python", "simple", "fast", "little", "output"
+)
+
+
+@dataclass
+class SiteParameters:
+    "The parameters of a synthetic site."
+
+    pages: int = 1000
+    "The number of pages."
+    markdown_size: int = 2000
+    "The approximate size of the markdown of each page in bytes."
+    layouts: int = 1
+    "The number of layouts."
+    include_bytes: int = 1 << 20
+    "The total size of the files in the include folder in bytes."
+    depth: int = 2
+    "The maximum nesting depth of the folders of pages."
+    seed: int = 0
+    "The seed of the random generator."
+
+
+def page_path(parameters: SiteParameters, index: int) -> str:
+    """Get the path to the page of the index.
+    The pages are grouped by ``depth + 1`` consecutive indices, and the pages in a group are put one level deeper each,
+    so the folder of a page always has the page of the previous index in its parent folder."""
+    level = index % (parameters.depth + 1)
+    # 親のフォルダにページがないと、nisshiはそのフォルダを出力先に作らずに子のフォルダを作ろうとして失敗する。
+    folders = [f"section{index // (parameters.depth + 1) % 10}"] * level
+    return join("inputs", *folders, f"page{index}.md")
+
+
+def _markdown(random: Random, size: int) -> str:
+    parts: list[str] = []
+    length = 0
+    while length < size:
+        match random.randrange(4):
+            case 0:
+                part = "## " + " ".join(random.choices(WORDS, k=4)).title()
+            case 1:
+                part = "\n".join(
+                    "- " + " ".join(random.choices(WORDS, k=5)) for _ in range(4)
+                )
+            case 2:
+                part = "```python\nprint(%r)\n```" % " ".join(random.choices(WORDS, k=3))
+            case _:
+                part = " ".join(
+                    f"**{word}**" if random.random() < 0.1 else word
+                    for word in random.choices(WORDS, k=40)
+                ) + "."
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def _write(path: str, text: str | bytes) -> None:
+    makedirs(dirname(path) or ".", exist_ok=True)
+    with open(path, "w" if isinstance(text, str) else "wb") as f:
+        f.write(text)
+
+
+def generate_site(root: str, parameters: SiteParameters, async_build: bool = False) -> None:
+    """Generate a synthetic site into the folder.
+
+    Args:
+        root: The path to the folder.
+        parameters: The parameters of the site.
+        async_build: Whether to enable :attr:`nisshi.Config.async_build`.
+            Then the layouts read a file with ``await aioinclude``, so they can only be rendered asynchronously."""
+    random = Random(parameters.seed)
+
+    for index in range(max(parameters.layouts, 1)):
+        _write(join(root, "layouts", "layout.html" if index == 0 else f"layout{index}.html"), (
+            "<!DOCTYPE html>\n<html><head><title>^^ self.ctx.title ^^</title>"
+            "^^ self.ctx.head ^^</head>\n<body><header>Layout %d</header>\n"
+            "<main>^^ self.content ^^</main>\n"
+            "<footer>^^ ', '.join(sorted(self.manager.config.metadata)) ^^%s</footer>"
+            "</body></html>\n" % (index, ' ^^ await aioinclude("includes/style.css") ^^' if async_build else "")
+        ))
+
+    for index in range(parameters.pages):
+        layout = index % max(parameters.layouts, 1)
+        header = f'^^\nself.ctx.title = "Page {index}"\n'
+        if layout:
+            header += f'self.layout = "layouts/layout{layout}.html"\n'
+        _write(join(root, page_path(parameters, index)), "%s^^\n# Page %d\n\n%s\n" % (
+            header, index, _markdown(random, parameters.markdown_size)
+        ))
+
+    # インクルードするファイルを作る。
+    files = max(1, min(10, parameters.include_bytes // (1 << 16)))
+    for index in range(files):
+        _write(
+            join(root, "includes", "assets", f"asset{index}.bin"),
+            random.randbytes(parameters.include_bytes // files)
+        )
+    _write(join(root, "includes", "style.css"), "body { margin: 0; }\n")
+    _write(join(root, "nisshi.toml"), "%s[metadata]\nsite = \"benchmark\"\n" % (
+        "async_build = true\n" if async_build else ""
+    ))
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    "Add the arguments for :class:`SiteParameters` to the parser."
+    for name, value in asdict(SiteParameters()).items():
+        parser.add_argument(
+            "--" + name.replace("_", "-"), type=int, default=value,
+            help=f"The {name.replace('_', ' ')} of the site. (Default: {value})"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Generate a synthetic site for benchmarks.")
+    parser.add_argument("directory")
+    parser.add_argument("--async-build", action="store_true", help="Enable async_build and use await in the layouts.")
+    add_arguments(parser)
+    args = vars(parser.parse_args())
+    directory, async_build = args.pop("directory"), args.pop("async_build")
+    generate_site(directory, SiteParameters(**args), async_build)
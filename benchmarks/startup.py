@@ -0,0 +1,120 @@
+# nisshi - Benchmarks - Startup
+
+"""Benchmark the time to import nisshi with ``python -X importtime``.
+
+It measures the cumulative import time of these cases and fails if one of them is over its budget
+or imports a module which should be imported only when it is needed (e.g. watchdog for hot reload).
+
+* ``version``: ``nisshi --version``
+* ``package``: ``import nisshi``
+* ``manager``: Making :class:`nisshi.Manager`, which is needed by ``nisshi build``.
+* ``build_all``: :meth:`nisshi.Manager.build_all` on an empty site, which renders nothing and so must not import the markdown libraries.
+* ``client``: ``import nisshi.daemon``, which is needed by ``nisshi build --daemon``.
+
+Usage: ``python benchmarks/startup.py --repeat 5 --budget-scale 1.0``"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from argparse import ArgumentParser
+from subprocess import run
+from tempfile import mkdtemp
+from os.path import abspath, dirname
+from shutil import rmtree
+import sys
+
+
+ROOT = dirname(dirname(abspath(__file__)))
+CASES = {
+    "version": (
+        "import sys; sys.argv = ['nisshi', '--version']\n"
+        "try:\n    import nisshi.__main__\nexcept SystemExit:\n    pass",
+        100.0, ("rich", "watchdog", "tempylate", "mistletoe", "mizu", "toml", "asyncio")
+    ),
+    "package": (
+        "import nisshi", 25.0,
+        ("click", "rich", "watchdog", "tempylate", "mistletoe", "mizu", "toml", "asyncio")
+    ),
+    "manager": (
+        "import nisshi; nisshi.Manager(nisshi.Config())", 300.0,
+        ("watchdog", "mistletoe", "mizu", "nisshi.server", "sqlite3", "concurrent.futures.process")
+    ),
+    "build_all": (
+        "import os, nisshi\n"
+        "for folder in ('inputs', 'layouts', 'includes'):\n    os.makedirs(folder, exist_ok=True)\n"
+        "nisshi.Manager(nisshi.Config()).build_all()", 400.0,
+        ("watchdog", "mistletoe", "mizu", "nisshi.server", "nisshi.markdown", "concurrent.futures.process")
+    ),
+    "client": (
+        "import nisshi.daemon", 40.0,
+        ("rich", "watchdog", "tempylate", "mistletoe", "mizu", "toml", "asyncio", "nisshi.manager")
+    )
+}
+"The code of each case, its budget in milliseconds and the modules which must not be imported."
+
+
+def measure(code: str, cwd: str) -> tuple[float, set[str]]:
+    """Run the code with ``-X importtime`` and get the total import time in milliseconds and the imported modules.
+
+    Args:
+        code: The code.
+        cwd: The working directory."""
+    result = run(
+        (sys.executable, "-X", "importtime", "-c", code), cwd=cwd,
+        env={"PYTHONPATH": ROOT}, capture_output=True, text=True
+    )
+    total, modules = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        # インデントされていないものがトップレベルのインポートなので、それを合計する。
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1000, modules
+
+
+def main(repeat: int, budget_scale: float) -> dict[str, Any]:
+    """Run the benchmark.
+
+    Args:
+        repeat: The number of times to measure each case. The best one is used.
+        budget_scale: The number to multiply each budget by. It is for slow machines."""
+    # 設定ファイル等が読み込まれないように、空のフォルダで実行する。
+    cwd = mkdtemp(prefix="nisshi-startup-")
+    results: dict[str, Any] = {}
+    try:
+        for name, (code, budget, forbidden) in CASES.items():
+            times, modules = [], set()
+            for _ in range(repeat):
+                time, modules = measure(code, cwd)
+                times.append(time)
+            results[name] = {
+                "ms": min(times), "budget": budget * budget_scale,
+                "forbidden": sorted(
+                    module for module in modules
+                    if any(module == f or module.startswith(f"{f}.") for f in forbidden)
+                )
+            }
+    finally:
+        rmtree(cwd, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the time to import nisshi.")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of times to measure each case.")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="The number to multiply each budget by.")
+    args = parser.parse_args()
+
+    failed = False
+    for name, result in main(args.repeat, args.budget_scale).items():
+        ok = result["ms"] <= result["budget"] and not result["forbidden"]
+        failed |= not ok
+        print("{:<10}{:>10.1f}ms / {:>7.1f}ms  {}{}".format(
+            name, result["ms"], result["budget"], "ok" if ok else "FAILED",
+            f"  (imported: {', '.join(result['forbidden'])})" if result["forbidden"] else ""
+        ))
+    sys.exit(1 if failed else 0)
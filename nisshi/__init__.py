@@ -1,12 +1,21 @@
 # nisshi
 
-from .waste_checker import WasteChecker
-from .common import Context
-from .caches import Caches
-from .manager import Manager
-from .tools import Bundle
-from .page import Page, PageContext
-from .config import Config
+from __future__ import annotations
+
+from importlib import import_module
+
+# `typing`を読み込むと遅くなるので、読み込まずに型チェッカー向けのインポートをする。
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any
+
+    from .waste_checker import WasteChecker
+    from .common import Context
+    from .caches import Caches
+    from .manager import Manager
+    from .tools import Bundle
+    from .page import Page, PageContext
+    from .config import Config
 
 
 __all__ = (
@@ -16,4 +25,24 @@ __all__ = (
 
 
 __version__ = "0.1.1"
-__author__ = "tasuren"
\ No newline at end of file
+__author__ = "tasuren"
+
+
+# 起動を速くするために、クラスは使われた時にそのモジュールを読み込む。
+_MODULES = {
+    "WasteChecker": "waste_checker", "Context": "common", "Caches": "caches",
+    "Manager": "manager", "Bundle": "tools", "Page": "page",
+    "PageContext": "page", "Config": "config"
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _MODULES:
+        value = getattr(import_module(f".{_MODULES[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return list(__all__)
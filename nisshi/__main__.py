@@ -1,25 +1,34 @@
 # nisshi - Main
 
 from os.path import exists
-
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from os import getcwd
 
 import click
 
-from nisshi import __version__, Manager, Config
-from nisshi.config import CURRENT
+from nisshi import __version__
 
 
-from sys import path
-path.append(CURRENT)
+from sys import path, stdout
+path.append(getcwd())
 
 
 def _build(
     config_file: str, hot_reload: bool,
-    address: tuple[str, int] = ("", 0)
+    address: tuple[str, int] | None = None,
+    jobs: int | None = None, in_memory: bool = False,
+    profile: str | None = None, shard: tuple[int, int] | None = None
 ):
     # ビルドをします。また、ホットリロードやサーバーの立ち上げをします。
-    manager = Manager(Config.from_file(config_file, True))
+    # `nisshi --version`等を速くするために、ここで読み込む。
+    from nisshi import Manager, Config
+    config = Config.from_file(config_file, True)
+    if jobs is not None:
+        config.workers = jobs
+    config.in_memory = in_memory
+    config.profile = profile is not None
+    if shard is not None:
+        config.shard_index, config.shard_count = shard
+    manager = Manager(config)
     manager.console.quiet = False
 
     if exists(manager.config.script_folder):
@@ -29,21 +38,20 @@ def _build(
         manager.build_all()
         # ファイル監視をするための設定をする。
         if address is None:
-            manager.build_hot_reload()
+            manager.build_hot_reload(config_file=config_file)
         else:
+            from nisshi.server import DevServer
             manager.console.log("Starting web server: http://%s:%s" % address)
-            class PatchedHTTPRequestHandler(SimpleHTTPRequestHandler):
-                def __init__(self, *args, **kwargs):
-                    kwargs["directory"] = manager.config.output_folder
-                    super().__init__(*args, **kwargs)
-                def log_message(self, format, *args):
-                    manager.console.log("Serve", self.address_string(), (format % args))
-            app = HTTPServer(address, PatchedHTTPRequestHandler)
-            manager.build_hot_reload(app.serve_forever)
-            app.shutdown()
+            app = DevServer(manager, *address)
+            manager.build_hot_reload(app.serve_forever, config_file)
     else:
         manager.build_all()
 
+    if profile is not None:
+        manager.tracer.export(profile)
+        manager.console.log(f"The trace was written to {profile}.")
+        manager.console.print(manager.tracer.report(), markup=False, highlight=False)
+
 
 @click.group(invoke_without_command=True)
 @click.option("-v", "--version", default=False, is_flag=True, help="Displays the version.")
@@ -62,18 +70,117 @@ def cli(version: bool):
     "--hot-reload", default=False, is_flag=True,
     help="Automatically builds when changes are made to the contents of the source folder."
 )
-def build(config_file: str, hot_reload: bool):
+@(_jobs_option := click.option(
+    "-j", "--jobs", type=int, default=None,
+    help="The number of processes used to render pages. (0 means the number of CPUs.)"
+))
+@click.option(
+    "--profile", type=click.Path(dir_okay=False, writable=True),
+    is_flag=False, flag_value="nisshi-trace.json", default=None,
+    help="Records how long each phase of the build takes and writes it as Chrome trace JSON. (Default path: nisshi-trace.json)"
+)
+@click.option(
+    "--shard", default=None, metavar="I/N",
+    help="Builds only the I-th of N parts of the files so that the build can be split across several machines. The results are combined by `nisshi merge`."
+)
+@click.option(
+    "--daemon", "use_daemon", default=False, is_flag=True,
+    help="Asks the daemon started by `nisshi daemon` to build. If no daemon is running, builds in this process."
+)
+@(_socket_option := click.option(
+    "--socket", "socket_path", type=click.Path(dir_okay=False),
+    default=".nisshi.sock", help="The path to the socket of the daemon."
+))
+def build(
+    config_file: str, hot_reload: bool, jobs: int | None,
+    profile: str | None, shard: str | None, use_daemon: bool, socket_path: str
+):
     "All markdowns in the source folder are converted to HTML and output to the output folder."
-    _build(config_file, hot_reload)
+    if use_daemon:
+        if hot_reload or shard is not None:
+            raise click.UsageError("--daemon cannot be used with --hot-reload or --shard.")
+        from nisshi.daemon import request
+        from shutil import get_terminal_size
+        response = request(
+            "build", socket_path, config_file=config_file, jobs=jobs, profile=profile,
+            width=get_terminal_size().columns, color=stdout.isatty()
+        )
+        if response is not None:
+            stdout.write(response["output"])
+            if not response["ok"]:
+                click.echo(response["error"], err=True)
+                raise SystemExit(1)
+            return
+        click.echo("No daemon is running, so the build is done in this process.", err=True)
+    if shard is not None:
+        if hot_reload:
+            raise click.UsageError("--shard cannot be used with --hot-reload.")
+        from nisshi.shard import parse_shard
+        try:
+            parsed_shard = parse_shard(shard)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--shard")
+    else:
+        parsed_shard = None
+    _build(config_file, hot_reload, jobs=jobs, profile=profile, shard=parsed_shard)
+
+
+@cli.command()
+@_config_file_option
+@click.argument("directories", nargs=-1, type=click.Path(file_okay=False, exists=True))
+def merge(config_file: str, directories: tuple[str, ...]):
+    """Combines the outputs and the caches of builds made with `nisshi build --shard` and cleans the output folder.
+    DIRECTORIES are the folders where the sharded builds were run. Their output folders are copied to the output folder."""
+    from nisshi import Manager, Config
+    manager = Manager(Config.from_file(config_file, True))
+    manager.console.quiet = False
+    manager.merge_shards(directories)
+
+
+@cli.command()
+@_config_file_option
+@_socket_option
+@click.option("--status", default=False, is_flag=True, help="Displays the state of the running daemon.")
+@click.option("--stop", default=False, is_flag=True, help="Stops the running daemon.")
+def daemon(config_file: str, socket_path: str, status: bool, stop: bool):
+    """Starts the daemon which keeps the loaded extensions, the caches and the compiled templates and builds when `nisshi build --daemon` is run.
+    It listens on a Unix domain socket in the current folder."""
+    from nisshi.daemon import request
+    if status or stop:
+        response = request("stop" if stop else "status", socket_path, config_file=config_file)
+        if response is None:
+            raise click.ClickException("No daemon is running.")
+        if not response["ok"]:
+            raise click.ClickException(response["error"])
+        if status:
+            from nisshi.json import dumps
+            print(dumps(response["result"]))
+        return
+
+    from nisshi.daemon import Daemon, DaemonError
+    instance = Daemon(config_file, socket_path)
+    instance.console.quiet = False
+    instance.console.log(f"Starting the daemon: {socket_path}")
+    try:
+        instance.serve_forever()
+    except DaemonError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        ...
 
 
 @cli.command()
 @_config_file_option
 @click.option("-p", "--port", help="The port.", default=8000)
 @click.option("-h", "--host", help="The host.", default="127.0.0.1")
-def serve(config_file: str, port: int, host: str):
-    "Run HTTP servers simultaneously using `http.server` from the standard Python library."
-    _build(config_file, True, (host, port))
+@_jobs_option
+@click.option(
+    "--in-memory", default=False, is_flag=True,
+    help="Keeps the outputs in memory and serves them instead of writing them to the output folder."
+)
+def serve(config_file: str, port: int, host: str, jobs: int | None, in_memory: bool):
+    "Build with hot reload and run a development server which reloads pages in browsers when they are rebuilt."
+    _build(config_file, True, (host, port), jobs, in_memory)
 
 
 def main():
@@ -2,16 +2,29 @@
 
 from __future__ import annotations
 
-from os.path import exists
+from typing import TYPE_CHECKING, Generic, TypeVar, Any, cast
+from collections.abc import Callable, Iterable, Iterator, Mapping, MutableMapping
 
-from .common import Context
+from collections import OrderedDict
+from bisect import insort
+from os.path import exists, join, splitext
+from os import makedirs, replace, remove, getpid, listdir, stat, utime
+import marshal
+
+from .common import Context, FastContext
 from .json import loads, dumps
 
+if TYPE_CHECKING:
+    import sqlite3
+
 
-__all__ = ("Caches", "OutputMetadata", "OutputMetadataContainer")
+__all__ = (
+    "Caches", "OutputMetadata", "FileDigest", "SQLiteCaches", "SQLiteSection",
+    "LRUCache", "get_cache_directory"
+)
 
 
-class OutputMetadata(Context):
+class OutputMetadata(FastContext):
     """Context for storing cache of output metadata.
     Output metadata is used to avoid having to re-build something that has already been built on :class:`.waste_checker.WasteChecker`."""
 
@@ -19,10 +32,44 @@ class OutputMetadata(Context):
     output_path: str | None
 
 
-class Caches(Context):
+class FileDigest(FastContext):
+    """Context for storing the digest of the contents of a file.
+    This is used by :class:`.waste_checker.WasteChecker` when :attr:`.config.Config.hash_check` is enabled."""
+
+    stat: list[int]
+    "The size, the last modified date in nanoseconds and the inode number of the file when the digest was made."
+    digest: str
+
+
+class Caches(FastContext):
     "Context for storing cache."
 
-    outputs: Context[OutputMetadata] = Context()
+    outputs: FastContext[OutputMetadata] = FastContext()
+    digests: FastContext[FileDigest] = FastContext()
+    dependencies: FastContext[list[str]] = FastContext()
+    "The paths to the templates (e.g. layouts) read when building each page."
+    dependents: FastContext[list[str]] = FastContext()
+    "The reverse index of :attr:`.dependencies`. The paths to the pages which depend on each template."
+    manifest: FastContext[list[str]] = FastContext()
+    "The paths to the outputs of each input. This is used by :meth:`.manager.Manager.clean`."
+    output_digests: FastContext[FileDigest] = FastContext()
+    """The digests of the contents of the output files when they were written.
+    This is used to skip writing outputs whose contents have not been changed by :meth:`.tools.OSTools.write_output`."""
+    fingerprint: FastContext[str] = FastContext()
+    """The digests of the things which can change the outputs at the last build.
+    They are each setting (e.g. ``config:metadata``), the code of the event listeners of pages and the replaceable classes (see :func:`.tools.fingerprint`) and the versions of nisshi, tempylate and the markdown backend.
+    When a setting is changed, only the pages which read it are rebuilt. When the others are changed, all the pages are rebuilt."""
+
+    _entry_types: dict[str, type[FastContext]] = {
+        "outputs": OutputMetadata, "digests": FileDigest, "output_digests": FileDigest
+    }
+
+    @classmethod
+    def _load_entry(cls, name: str, value: Any) -> Any:
+        # JSONから読み込んだ項目を、その部分の型のインスタンスにする。
+        if name in cls._entry_types:
+            return cls._entry_types[name](value)
+        return Context._transform(value)
 
     @classmethod
     def from_file(cls, path: str) -> Caches:
@@ -30,13 +77,396 @@ class Caches(Context):
         if exists(path):
             with open(path, 'r') as f:
                 raw = f.read()
-            data = cls(loads(raw))
+            data = cls()
+            for name, section in loads(raw).items():
+                data[name] = FastContext({
+                    key: cls._load_entry(name, value)
+                    for key, value in section.items()
+                }) if isinstance(section, dict) else section
         else:
-            with open(path, "w") as f:
-                f.write(dumps(data := cls()))
+            (data := cls()).save(path)
         return data
 
+    def set_dependencies(self, path: str, dependencies: Iterable[str]) -> None:
+        """Set the paths to the templates which the page depends on.
+        :attr:`.dependents` is also updated.
+
+        Args:
+            path: The path to the page.
+            dependencies: The paths to the templates."""
+        new = sorted(set(dependencies))
+        for dependency in set(self.dependencies.get(path, ())).difference(new):
+            dependents = self.dependents.get(dependency)
+            if dependents is not None and path in dependents:
+                dependents.remove(path)
+                if not dependents:
+                    del self.dependents[dependency]
+        for dependency in new:
+            if dependency not in self.dependents:
+                self.dependents[dependency] = []
+            if path not in self.dependents[dependency]:
+                insort(self.dependents[dependency], path)
+        if new:
+            self.dependencies[path] = new
+        elif path in self.dependencies:
+            del self.dependencies[path]
+
+    def extract(self, keys: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Extract the entries of the passed keys from each section of the cache.
+        This is used to bring caches made in other processes back with :meth:`.merge`.
+
+        Args:
+            keys: The keys of the entries. (e.g. the path to a page.)"""
+        keys = tuple(keys)
+        return {
+            name: {key: section[key] for key in keys if key in section}
+            for name, section in self.items()
+            if isinstance(section, Mapping) and name not in ("dependents", "fingerprint")
+        }
+
+    def merge(self, data: dict[str, dict[str, Any]]) -> None:
+        """Merge entries extracted by :meth:`.extract`.
+
+        Args:
+            data: The extracted entries."""
+        for name, entries in data.items():
+            if name == "dependencies":
+                # 逆引きも更新する必要がある。
+                for key, value in entries.items():
+                    self.set_dependencies(key, value)
+                continue
+            if name not in self:
+                self[name] = FastContext()
+            self[name].update(entries)
+
     def save(self, path: str) -> None:
         "Save cache."
-        with open(path, 'w') as f:
-            f.write(dumps(self))
\ No newline at end of file
+        # 書き込み途中で落ちてもキャッシュが壊れないように、一時ファイルに書き込んでから置き換える。
+        temporary = f"{path}.{getpid()}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                f.write(dumps(self))
+            replace(temporary, path)
+        except BaseException:
+            try:
+                remove(temporary)
+            except FileNotFoundError:
+                ...
+            raise
+
+
+class _SQLiteStore:
+    # SQLiteのデータベースへの接続を持つクラスです。
+    # フォークされたプロセスでは同じ接続を使えないので、プロセスが変わったら接続し直す。
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._pid = getpid()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != getpid():
+            import sqlite3
+            self._connection = sqlite3.connect(self.path, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (section TEXT NOT NULL, "
+                "key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (section, key)) "
+                "WITHOUT ROWID"
+            )
+            self._pid = getpid()
+        return self._connection
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        # 接続は`connection`が使われた時に開き直される。
+        self.path = state["path"]
+        self._connection = None
+        self._pid = getpid()
+
+
+class SQLiteSection(MutableMapping[str, Any]):
+    """A section of :class:`SQLiteCaches`.
+    Each entry is loaded from the database when it is used for the first time and only changed entries are written back.
+
+    Args:
+        store: The database.
+        name: The name of the section. (e.g. ``outputs``)
+        load: The function to make an entry from the value loaded from JSON."""
+
+    def __init__(
+        self, store: _SQLiteStore, name: str,
+        load: Callable[[str, Any], Any] = Caches._load_entry
+    ):
+        self.store, self.name, self.load = store, name, load
+        self._loaded: dict[str, Any] = {}
+        # 読み込んだ時のJSONです。保存時に変更があったかどうかを調べるのに使う。
+        self._original: dict[str, str | None] = {}
+        self._deleted: set[str] = set()
+        self._keys: set[str] | None = None
+
+    def _all_keys(self) -> set[str]:
+        # 全てのキーを値は読み込まずに取得する。
+        if self._keys is None:
+            self._keys = {row[0] for row in self.store.connection.execute(
+                "SELECT key FROM entries WHERE section = ?", (self.name,)
+            )}
+            self._keys.difference_update(self._deleted)
+            self._keys.update(self._loaded)
+        return self._keys
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._loaded:
+            return self._loaded[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        row = self.store.connection.execute(
+            "SELECT value FROM entries WHERE section = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        self._loaded[key] = value = self.load(self.name, loads(row[0]))
+        self._original[key] = row[0]
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._loaded[key] = value
+        self._original.setdefault(key, None)
+        self._deleted.discard(key)
+        if self._keys is not None:
+            self._keys.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._loaded.pop(key, None)
+        self._original.pop(key, None)
+        self._deleted.add(key)
+        if self._keys is not None:
+            self._keys.discard(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._loaded:
+            return True
+        if key in self._deleted or not isinstance(key, str):
+            return False
+        if self._keys is not None:
+            return key in self._keys
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(tuple(self._all_keys()))
+
+    def __len__(self) -> int:
+        return len(self._all_keys())
+
+    def __repr__(self) -> str:
+        return f"<SQLiteSection name={self.name!r} loaded={len(self._loaded)}>"
+
+    def _write(self, connection: sqlite3.Connection) -> None:
+        # 変更された項目だけをデータベースに書き込む。
+        connection.executemany(
+            "DELETE FROM entries WHERE section = ? AND key = ?",
+            ((self.name, key) for key in self._deleted)
+        )
+        changed = []
+        for key, value in self._loaded.items():
+            if (raw := dumps(value)) != self._original.get(key):
+                changed.append((self.name, key, raw))
+                self._original[key] = raw
+        connection.executemany(
+            "INSERT OR REPLACE INTO entries (section, key, value) VALUES (?, ?, ?)", changed
+        )
+        self._deleted.clear()
+
+
+class SQLiteCaches(Caches):
+    """Caches stored in a SQLite database.
+    Unlike :class:`Caches`, entries are loaded lazily and only changed entries are written on :meth:`.save`.
+    The changes are committed in one transaction, so the database is not corrupted even if the build is interrupted.
+    This is used when :attr:`.config.Config.caches_backend` is ``sqlite``.
+
+    Args:
+        path: The path to the database."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        object.__setattr__(self, "_store", store := _SQLiteStore(path))
+        for name in tuple(self.keys()):
+            self[name] = SQLiteSection(store, name, self._load_entry)
+
+    @classmethod
+    def from_file(cls, path: str) -> SQLiteCaches:
+        """Open the database next to the cache file. (e.g. ``.nisshi_caches.sqlite3``)
+        If there is the JSON cache file made by :class:`Caches`, its entries are moved to the database.
+
+        Args:
+            path: The path to the cache file. (:attr:`.config.Config.caches_file`)"""
+        self = cls(f"{splitext(path)[0]}.sqlite3")
+        if exists(path):
+            # JSONのキャッシュから移行する。
+            old = Caches.from_file(path)
+            for name, section in old.items():
+                if isinstance(section, Mapping) and name in self:
+                    self[name].update(section)
+            self.save(path)
+            remove(path)
+        return self
+
+    def save(self, path: str | None = None) -> None:
+        """Write the changed entries to the database.
+
+        Args:
+            path: This is not used. It is for compatibility with :meth:`Caches.save`."""
+        connection = self._store.connection
+        connection.execute("BEGIN")
+        try:
+            for section in self.values():
+                if isinstance(section, SQLiteSection):
+                    section._write(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+def get_cache_directory(caches_file: str, name: str) -> str:
+    """Get the path to the directory for storing caches next to the cache file.
+
+    Args:
+        caches_file: The path to the cache file.
+        name: The name of the kind of caches."""
+    return join(splitext(caches_file)[0], name)
+
+
+ValueT = TypeVar("ValueT")
+class LRUCache(Generic[ValueT]):
+    """Cache that discards the least recently used entries.
+    Entries can also be stored on disk with :mod:`marshal` so that other processes can use them.
+    The entries on disk are also limited. When there are more than ``disk_maxsize`` files, the least recently used ones are deleted
+    until three quarters of ``disk_maxsize`` are left. Whether a file was used recently is known from its last modified date, which is updated when it is read.
+
+    Args:
+        maxsize: The maximum number of entries kept in memory.
+        directory: The path to the directory for storing entries on disk.
+            If ``None``, entries are only kept in memory.
+        disk_maxsize: The maximum number of entries stored on disk."""
+
+    def __init__(
+        self, maxsize: int = 128, directory: str | None = None,
+        disk_maxsize: int = 4096
+    ):
+        self.maxsize, self.directory, self.disk_maxsize = maxsize, directory, disk_maxsize
+        self.data: OrderedDict[str, ValueT] = OrderedDict()
+        # ディスクにあるファイルの数です。最初に書き込む時に数える。
+        self._disk_count: int | None = None
+
+    def _put(self, key: str, value: ValueT) -> None:
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def get(self, key: str, default: ValueT | None = None) -> ValueT | None:
+        """Get the entry.
+
+        Args:
+            key: The key of the entry. It must be usable as a file name.
+            default: The value returned when the entry is not found."""
+        if key in self.data:
+            self.data.move_to_end(key)
+            return self.data[key]
+        if self.directory is not None and exists(path := join(self.directory, key)):
+            try:
+                with open(path, "rb") as f:
+                    value = marshal.load(f)
+                # 最近使われたものとして消されないように、更新日時を更新する。
+                utime(path)
+            except (OSError, EOFError, ValueError, TypeError):
+                return default
+            self._put(key, value)
+            return value
+        return default
+
+    def set(self, key: str, value: ValueT) -> None:
+        """Set the entry.
+
+        Args:
+            key: The key of the entry. It must be usable as a file name.
+            value: The value. It must be able to be serialized with :mod:`marshal` if the directory is set."""
+        self._put(key, value)
+        if self.directory is None:
+            return
+        # キーは中身から作られるので、既にファイルがある場合は書き込まずに更新日時だけ更新する。
+        if exists(path := join(self.directory, key)):
+            try:
+                utime(path)
+            except FileNotFoundError:
+                ...
+            else:
+                return
+        makedirs(self.directory, exist_ok=True)
+        # 他のプロセスが中途半端なファイルを読み込まないように、一時ファイルに書き込んでから置き換える。
+        temporary = f"{path}.{getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                # 値が`marshal`で保存できるものであることは、ディレクトリを設定する側が保証する。
+                marshal.dump(cast(Any, value), f)
+            replace(temporary, path)
+        except BaseException:
+            try:
+                remove(temporary)
+            except FileNotFoundError:
+                ...
+            raise
+
+        if self._disk_count is None:
+            self._disk_count = len(self._disk_files())
+        else:
+            self._disk_count += 1
+        if self._disk_count > self.disk_maxsize:
+            self.prune()
+
+    def _disk_files(self) -> list[str]:
+        # ディスクに保存されている項目のファイル名を取得する。書き込み途中の一時ファイルは含めない。
+        assert self.directory is not None
+        try:
+            return [name for name in listdir(self.directory) if not name.endswith(".tmp")]
+        except FileNotFoundError:
+            return []
+
+    def prune(self, size: int | None = None) -> None:
+        """Delete the least recently used entries on disk.
+
+        Args:
+            size: The number of entries left. If this is ``None``, three quarters of :attr:`.disk_maxsize` are left."""
+        if self.directory is None:
+            return
+        if size is None:
+            size = self.disk_maxsize * 3 // 4
+        files = []
+        for name in self._disk_files():
+            try:
+                files.append((stat(path := join(self.directory, name)).st_mtime_ns, path))
+            except FileNotFoundError:
+                # 他のプロセスに消された場合は無視する。
+                ...
+        files.sort()
+        for _, path in files[:max(0, len(files) - size)]:
+            try:
+                remove(path)
+            except FileNotFoundError:
+                ...
+        self._disk_count = min(len(files), size)
+
+    def clear(self) -> None:
+        "Clear the entries kept in memory."
+        self.data.clear()
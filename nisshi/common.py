@@ -4,8 +4,10 @@ from __future__ import annotations
 
 from typing import Generic, TypeVar, Any
 
+from operator import itemgetter
 
-__all__ = ("Context",)
+
+__all__ = ("Context", "FastContext")
 
 
 ValueT = TypeVar("ValueT")
@@ -49,6 +51,102 @@ class Context(dict[Any, ValueT], Generic[ValueT]):
         return super().__getattribute__(name)
 
 
+class _Field(property):
+    # 初期値のクラス属性の代わりに置いて、辞書の値を返すプロパティです。
+    # `itemgetter`を使うことで、Pythonの関数を呼ばずに値を取得できる。
+
+    def __init__(self, name: str, default: Any):
+        super().__init__(itemgetter(name))
+        self.default = default
+
+
+class _Key(property):
+    # 初期値のないキーを属性で取得した時に、クラスに追加されるプロパティです。
+    # Python 3.11では、`__getattr__`が呼ばれる前に`AttributeError`が作られるため遅い。
+    # なので、一度取得されたキーにはこのプロパティを置いて、二回目からはそれを使う。
+
+    def __init__(self, name: str):
+        def get(self_: dict[str, Any]) -> Any:
+            try:
+                return self_[name]
+            except KeyError:
+                raise AttributeError(
+                    f"{type(self_).__name__!r} object has no attribute {name!r}"
+                ) from None
+        super().__init__(get)
+
+
+class FastContext(Context[ValueT]):
+    """This is :class:`Context` which is faster to make and to access.
+    It is used for the classes made many times or accessed on every build such as :class:`.config.Config` and :class:`.page.PageContext`.
+
+    The differences from :class:`Context` are:
+
+    * The initial values are collected from the class attributes once when the class is made.
+      The class attributes are replaced with properties which return the values of the dictionary.
+    * The values are not transformed into :class:`Context`.
+    * The keys of the dictionary do not hide the methods and the attributes of the class.
+
+    Keys which are not class attributes can also be accessed via attributes.
+    The first access of such a key is slow, but a property for the key is then added to the class to make the next accesses faster."""
+
+    _defaults: dict[str, Any] = {}
+
+    def __init_subclass__(cls, **kwargs: Any):
+        super().__init_subclass__(**kwargs)
+        # 初期値を集めて、クラス属性は辞書の値を返すプロパティに置き換える。
+        defaults: dict[str, Any] = {}
+        for base in reversed(cls.__mro__[1:]):
+            defaults.update(vars(base).get("_defaults", {}))
+        for name, value in tuple(vars(cls).items()):
+            if not name.startswith("_") and not callable(value) \
+                    and not hasattr(value, "__get__"):
+                defaults[name] = value
+                setattr(cls, name, _Field(name, value))
+        cls._defaults = defaults
+
+    def __init__(self, *args: Any, **kwargs: ValueT):
+        dict.__init__(self, *args, **kwargs)
+        for name, value in self._defaults.items():
+            if name not in self:
+                if isinstance(value, dict):
+                    value = type(value)(value)
+                elif isinstance(value, list):
+                    value = value.copy()
+                self[name] = value
+
+    def __getattr__(self, name: str) -> ValueT:
+        # 普通の属性が見つからなかった場合のみ呼ばれる。
+        try:
+            value = self[name]
+        except KeyError:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            ) from None
+        if not name.startswith("_"):
+            type.__setattr__(type(self), name, _Key(name))
+        return value
+
+    __getattribute__ = object.__getattribute__ # type: ignore
+
+    def __dir__(self) -> list[str]:
+        # キーのために追加されたプロパティは、他のインスタンスにはないキーのこともあるので含めない。
+        cls = type(self)
+        return [
+            name for name in object.__dir__(self)
+            if not isinstance(getattr(cls, name, None), _Key)
+        ]
+
+    def __setattr__(self, name: str, value: ValueT) -> None:
+        self[name] = value
+
+    def __delattr__(self, name: str) -> None:
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
 def _color(m, c, t):
     return f"[{m} {c}]{t}[/{m} {c}]"
 def _green(text: str) -> str:
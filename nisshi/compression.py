@@ -0,0 +1,96 @@
+# nisshi - Compression
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from pathlib import PurePath
+from os import stat, utime, replace, remove, getpid
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+__all__ = ("ENCODINGS", "available_encodings", "sidecar_path", "compress_file", "is_fresh")
+
+
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+"The encodings which can be used for precompressed files and the extensions of their files. The order is the order of preference."
+
+
+def available_encodings(encodings: Iterable[str]) -> tuple[str, ...]:
+    """Get the encodings which can be used in this environment.
+    ``br`` can only be used when the ``brotli`` package is installed.
+
+    Args:
+        encodings: The names of the encodings. (e.g. ``("gzip", "br")``)"""
+    return tuple(
+        encoding for encoding in ENCODINGS
+        if encoding in encodings and (encoding != "br" or brotli is not None)
+    )
+
+
+def sidecar_path(path: PurePath | str, encoding: str) -> str:
+    """Get the path to the precompressed file of the file.
+
+    Args:
+        path: The path to the file.
+        encoding: The encoding."""
+    return f"{path}{ENCODINGS[encoding]}"
+
+
+def is_fresh(path: PurePath | str, encoding: str) -> bool:
+    """Whether the precompressed file is made from the current contents of the file.
+    The precompressed file has the same last modified date as the file when it is made.
+
+    Args:
+        path: The path to the file.
+        encoding: The encoding."""
+    try:
+        return stat(sidecar_path(path, encoding)).st_mtime_ns == stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def compress_file(path: PurePath | str, encoding: str) -> bool:
+    """Make the precompressed file of the file. (e.g. ``index.html.gz``)
+    If it is already made from the current contents of the file, nothing is done.
+    This releases the GIL while compressing, so it can be run in threads.
+
+    Args:
+        path: The path to the file.
+        encoding: The encoding. It is one of :data:`ENCODINGS`.
+
+    Returns:
+        Whether the precompressed file was made."""
+    if is_fresh(path, encoding):
+        return False
+
+    # 読み込み中に変更された場合に新しい日付にならないように、先に日付を取得しておく。
+    result = stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    if encoding == "br":
+        assert brotli is not None
+        data = brotli.compress(data)
+    else:
+        data = gzip.compress(data, 9, mtime=0)
+
+    # 中途半端なファイルが配信されないように、一時ファイルに書き込んでから置き換える。
+    destination = sidecar_path(path, encoding)
+    temporary = f"{destination}.{getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(data)
+        utime(temporary, ns=(result.st_atime_ns, result.st_mtime_ns))
+        replace(temporary, destination)
+    except BaseException:
+        try:
+            remove(temporary)
+        except FileNotFoundError:
+            ...
+        raise
+    return True
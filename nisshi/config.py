@@ -3,23 +3,59 @@
 from __future__ import annotations
 
 from typing import Any
-from collections.abc import Sequence
+from collections.abc import Iterator, Sequence
 
+from contextlib import contextmanager
+from contextvars import ContextVar
 from os.path import exists
 from os import getcwd
 
-from toml import load
+from .common import Context, FastContext
 
-from .common import Context
 
-
-__all__ = ("Config",)
+__all__ = ("Config", "record_reads")
 
 
 CURRENT = getcwd()
-
-
-class Config(Context[Any]):
+_DEPENDENCY_PREFIX = "config:"
+_reads: ContextVar[set[str] | None] = ContextVar("_reads", default=None)
+
+
+@contextmanager
+def record_reads(reads: set[str] | None = None) -> Iterator[set[str]]:
+    """Record the keys of :class:`Config` read in this context.
+    It is used to know which settings each page depends on, so that only the pages which read a changed setting are rebuilt.
+    The keys are recorded per task, so it can also be used while pages are rendered concurrently with :attr:`Config.async_build`.
+
+    Args:
+        reads: The set to which the keys are added. If this is ``None``, a new set is made.
+
+    Returns:
+        The set of the keys."""
+    global _recording
+    token = _reads.set(reads := set() if reads is None else reads)
+    # 普段の設定の読み込みが遅くならないように、記録している間だけ`__getitem__`を置き換える。
+    if not _recording:
+        Config.__getitem__ = _record_read # type: ignore
+    _recording += 1
+    try:
+        yield reads
+    finally:
+        _recording -= 1
+        if not _recording:
+            del Config.__getitem__
+        _reads.reset(token)
+
+
+_recording = 0
+def _record_read(self: Config, key: str) -> Any:
+    # 読み込まれた設定を記録している場合は、キーを記録する。
+    if (reads := _reads.get()) is not None:
+        reads.add(key)
+    return dict.__getitem__(self, key)
+
+
+class Config(FastContext[Any]):
     """Context for storing settings.
     It can also be written to a configuration file."""
 
@@ -39,12 +75,90 @@ class Config(Context[Any]):
     "The name of the file for the default layout."
     caches_file = ".nisshi_caches.json"
     "The name of the cache file."
+    caches_backend = "json"
+    """The way to store the cache. It is ``json`` or ``sqlite``.
+    If it is ``sqlite``, the cache is stored in a SQLite database next to :attr:`.caches_file` (e.g. ``.nisshi_caches.sqlite3``) with :class:`.caches.SQLiteCaches`.
+    Its entries are loaded lazily and only changed entries are written, which is faster for large websites.
+    The JSON cache file is moved to the database when it is used for the first time."""
+    persistent_caches: bool = False
+    """Whether to store caches such as compiled templates and HTML converted from markdown on disk next to :attr:`.caches_file`.
+    Then other processes (e.g. the next build) can reuse them."""
+    template_cache_size: int = 256
+    "The maximum number of compiled templates kept in memory."
+    markdown_cache_size: int = 1024
+    "The maximum number of results of converting markdown to HTML kept in memory."
+    persistent_cache_size: int = 4096
+    """The maximum number of entries of each kind of caches stored on disk when :attr:`.persistent_caches` is enabled.
+    When there are more entries, the least recently used ones are deleted."""
+    include_sync = "copy"
+    """The way to copy files in the include folder to the output folder.
+    It is one of ``copy``, ``hardlink``, ``reflink`` and ``copy_file_range``.
+    If the way is not available (e.g. the file system does not support reflinks), files are copied normally.
+    The last modified date is preserved and files whose size and last modified date are the same as the source are not copied again."""
+    compress: Sequence[str] = ()
+    """The encodings of the precompressed files made next to the output files. (e.g. ``["gzip", "br"]``)
+    For example, ``outputs/index.html.gz`` is made for ``outputs/index.html``.
+    They are made in threads after building all and only remade when the output file is changed.
+    ``br`` is only used when the ``brotli`` package is installed."""
+    compress_exts: Sequence[str] = ("html", "css", "js", "mjs", "json", "svg", "xml", "txt")
+    "The file formats of the output files which are precompressed."
     input_exts: Sequence[str] = ("md",)
     "File format of the input."
     output_ext = "html"
     "The file format of the output."
     force_build: bool = False
-    "Whether to make sure that everything that has already been built is also built."
+    """Whether to make sure that everything that has already been built is also built.
+    It is not needed when the configuration or the extensions are changed because the changes are detected with :attr:`.caches.Caches.fingerprint`."""
+    hash_check: bool = False
+    """Whether to judge whether files have been changed by the digest of their contents instead of the last modified date.
+    The digest is only remade when the size, the last modified date or the inode number of the file changes, so builds after ``git checkout`` do not rebuild untouched files."""
+    workers: int = 1
+    """The number of processes used to render pages on :meth:`Manager.build_all`.
+    If this is greater than 1, each worker process builds its own :class:`Manager` and loads the extensions, so page events are dispatched in the worker processes.
+    ``on_before_build_directory`` and ``on_after_build_directory`` are dispatched in this process before and after the results of the files in each folder are applied.
+    If this is 0, the number of CPUs is used."""
+    async_build: bool = False
+    """Whether to render pages concurrently on an event loop on :meth:`Manager.build_all`.
+    Then templates are rendered with :meth:`tempylate.template.Template.aiorender`, so their blocks can use ``await`` (e.g. ``await aioinclude("...")``),
+    and event listeners of ``on_before_build_page`` and ``on_after_build_page`` can be coroutine functions.
+    Output files are written in threads. If this is enabled, :attr:`.workers` is not used for rendering.
+    If there are event listeners of ``on_before_build_directory`` or ``on_after_build_directory``, the pages are rendered concurrently folder by folder so that the events wrap the pages of each folder."""
+    concurrency: int = 16
+    "The maximum number of pages rendered at the same time when :attr:`.async_build` is enabled."
+    isolated_render: bool = False
+    """Whether to render pages in supervised worker processes.
+    A worker process which takes longer than :attr:`.page_timeout` for a page or uses more memory than :attr:`.page_memory_limit` is killed, the page is reported as an error and the build continues.
+    The number of worker processes is :attr:`.workers`. Pages built by hot reload are also built in a worker process.
+    If this is enabled, :attr:`.async_build` is not used."""
+    page_timeout: float = 60.0
+    "The maximum number of seconds to render a page when :attr:`.isolated_render` is enabled. If this is 0, there is no limit."
+    page_memory_limit: int = 0
+    """The maximum size of the address space of each worker process in megabytes when :attr:`.isolated_render` is enabled.
+    It is not used on platforms which do not support ``RLIMIT_AS``. If this is 0, there is no limit."""
+    in_memory: bool = False
+    """Whether to keep the outputs in memory instead of writing them to the output folder.
+    This is used by ``nisshi serve --in-memory``. The caches are not saved in this mode."""
+    shard_index: int = 1
+    "The number of the shard (from 1) built by this build. See :attr:`.shard_count`."
+    shard_count: int = 1
+    """The number of shards of the build.
+    If this is greater than 1, only the files whose paths are hashed into :attr:`.shard_index` are built so that the build can be split across several machines.
+    The cache is stored in a file for the shard (e.g. ``.nisshi_caches.shard-1-of-4.json``) and the output folder is not cleaned.
+    If the file for the shard does not exist, the entries of the files of the shard are taken from the cache file of the whole build (:attr:`.caches_file`) if it exists.
+    The results are combined by :meth:`.manager.Manager.merge_shards` (``nisshi merge``).
+    This is set by ``nisshi build --shard 1/4``.
+    If the shards are built on other machines, enable :attr:`.hash_check` because the last modified dates of the files differ on each machine."""
+    full_clean: bool = False
+    """Whether to scan the whole output folder to find files to be deleted on clean.
+    By default, files are found from the difference between the output manifest of the last build and that of the current build."""
+    hot_reload_delay: float = 0.2
+    """The number of seconds to wait for other file changes on hot reload.
+    Changes made within this time (e.g. by saving a file in an editor or ``git pull``) are built in one batch."""
+    hot_reload_ignores: Sequence[str] = ("*.swp", "*.swx", "*~", ".#*", "*.tmp", "*.pyc")
+    "Glob patterns of the paths or the names of files whose changes are ignored on hot reload."
+    profile: bool = False
+    """Whether to record how long each phase of a build takes with :class:`.tracing.Tracer`.
+    This is enabled by ``nisshi build --profile``."""
     debug_mode: bool = False
     "If this is set to `True`, the error will be displayed in full when an error occurs."
     extensions: Sequence[str] = ()
@@ -54,6 +168,9 @@ class Config(Context[Any]):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # テンプレートから`config.metadata.title`のようにアクセスできるようにする。
+        for key, value in self.items():
+            self[key] = self._transform(value)
         self.FOLDERS = tuple(
             value for name, value in map(lambda n: (n, getattr(self, n)), dir(self))
             if name.endswith("_folder")
@@ -71,6 +188,7 @@ class Config(Context[Any]):
             path: The path to the configuration file.
             ignore_missing: Whether to ignore missing the configuration file."""
         if not ignore_missing or exists(path):
+            from toml import load
             with open(path, "r") as f:
                 raw = load(f)
         else:
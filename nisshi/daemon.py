@@ -0,0 +1,275 @@
+# nisshi - Daemon
+
+from __future__ import annotations
+
+from io import StringIO
+from time import time
+import socket
+
+from os import getcwd, getpid, remove, stat, walk
+from os.path import exists, join, splitext
+
+# `nisshi build --daemon`を速くするために、重いモジュールは読み込まない。
+from json import loads, dumps
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any
+
+    from .manager import Manager
+
+
+__all__ = ("SOCKET_PATH", "DaemonError", "request", "Daemon")
+
+
+SOCKET_PATH = ".nisshi.sock"
+"The default path to the socket of the daemon."
+
+
+class DaemonError(Exception):
+    "Raised when the daemon cannot be started."
+
+
+def request(command: str, path: str = SOCKET_PATH, **kwargs: Any) -> dict[str, Any] | None:
+    """Send the request to the daemon and wait for the response.
+    This does not import the other modules of nisshi so that it is fast.
+
+    Args:
+        command: The command. It is ``build``, ``clean``, ``status`` or ``stop``.
+        path: The path to the socket of the daemon.
+        **kwargs: The arguments of the command.
+
+    Returns:
+        The response. If no daemon is running, ``None`` is returned."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        client.sendall(f"{dumps(kwargs | {'command': command, 'cwd': getcwd()})}\n".encode())
+        with client.makefile("rb") as f:
+            line = f.readline()
+    # 途中で落ちた場合は、デーモンが動いていないことにする。
+    return loads(line) if line else None
+
+
+class Daemon:
+    """The daemon which keeps a :class:`Manager` and builds with it when it receives requests from :func:`request`.
+    Then the loaded extensions, the caches and the compiled templates are reused, so a build does not pay for starting nisshi.
+    It listens on the Unix domain socket and the requests and the responses are JSON lines.
+    The requests are handled one by one.
+
+    The manager is made again when the configuration file is changed.
+    When the files in :attr:`.config.Config.script_folder` are changed, the extension is reloaded with :meth:`Manager.reload_extension`,
+    and all the pages are rebuilt on the next build only if the event listeners which can change pages were changed.
+    The caches are loaded again when the cache file is changed by other processes (e.g. ``nisshi build`` without ``--daemon``).
+
+    Args:
+        config_file: The path to the configuration file.
+        path: The path to the socket."""
+
+    def __init__(self, config_file: str = "nisshi.toml", path: str = SOCKET_PATH):
+        from rich.console import Console
+
+        self.config_file, self.path = config_file, path
+        self.console = Console(quiet=True)
+        "The console of the daemon. The logs of each request are written to it."
+        self.cwd = getcwd()
+        self.manager: Manager | None = None
+        self.started_at = time()
+        self.builds = 0
+        self.last_build: dict[str, Any] | None = None
+        self._config_mtime: int | None = None
+        self._scripts: tuple[Any, ...] = ()
+        self._force_pages = False
+        self._caches_mtime: int | None = None
+        self._running = False
+
+    def _get_config_mtime(self) -> int | None:
+        return stat(self.config_file).st_mtime_ns if exists(self.config_file) else None
+
+    def _get_scripts(self, script_folder: str) -> tuple[Any, ...]:
+        # エクステンションのファイルの更新日時を集める。
+        return tuple(
+            (join(current, name), stat(join(current, name)).st_mtime_ns)
+            for current, _, names in walk(script_folder)
+            for name in sorted(names)
+        )
+
+    def _caches_path(self) -> str:
+        # キャッシュが実際に保存されるファイルのパスを取得する。
+        assert self.manager is not None
+        if self.manager.config.caches_backend == "sqlite":
+            return f"{splitext(self.manager.caches_file)[0]}.sqlite3"
+        return self.manager.caches_file
+
+    def _caches_file_mtime(self) -> int | None:
+        path = self._caches_path()
+        return stat(path).st_mtime_ns if exists(path) else None
+
+    def prepare_manager(self) -> Manager:
+        """Get the manager.
+        It is made if it has not been made yet or the configuration has been changed.
+        If the extension in :attr:`.config.Config.script_folder` has been changed, it is reloaded."""
+        from .manager import Manager
+        from .config import Config
+
+        if self.manager is None or self._get_config_mtime() != self._config_mtime:
+            config = Config.from_file(self.config_file, True)
+            # 置き換えられたクラス等が元に戻るように、前のエクステンションは取り除いておく。
+            if self.manager is not None:
+                for name in tuple(self.manager.extensions):
+                    self.manager.unload_extension(name)
+            self.manager = Manager(config)
+            self.manager.console = self.console
+            if exists(config.script_folder):
+                self.manager.load_extension(config.script_folder)
+            self._config_mtime = self._get_config_mtime()
+            self._scripts = self._get_scripts(config.script_folder)
+            self._caches_mtime = self._caches_file_mtime()
+            self._force_pages = False
+        elif (scripts := self._get_scripts(self.manager.config.script_folder)) != self._scripts:
+            self._scripts = scripts
+            self._force_pages |= self.manager._reload_scripts()
+        if self._caches_file_mtime() != self._caches_mtime:
+            # 他のプロセスでキャッシュが変更された場合は、読み込み直す。
+            self.manager.caches = type(self.manager.caches).from_file(self.manager.caches_file)
+            self._caches_mtime = self._caches_file_mtime()
+        return self.manager
+
+    def build(self, jobs: int | None = None, profile: str | None = None) -> dict[str, Any]:
+        """Build with :meth:`Manager.build_all`.
+
+        Args:
+            jobs: The number of processes used to render pages. If this is ``None``, :attr:`.config.Config.workers` is used.
+            profile: The path to the file where the trace is written. If this is ``None``, the build is not traced.
+
+        Returns:
+            The numbers of the processed files."""
+        from .tracing import Tracer
+
+        manager = self.prepare_manager()
+        workers, tracer = manager.config.workers, manager.tracer
+        if jobs is not None:
+            manager.config.workers = jobs
+        if profile is not None:
+            # ワーカープロセスでも記録されるように、設定も変える。
+            manager.config.profile, manager.tracer = True, Tracer(True)
+        start_at = time()
+        try:
+            manager.build_all(self._force_pages)
+            self._force_pages = False
+            if profile is not None:
+                manager.tracer.export(profile)
+                manager.console.log(f"The trace was written to {profile}.")
+                manager.console.print(manager.tracer.report(), markup=False, highlight=False)
+        finally:
+            manager.config.workers, manager.tracer = workers, tracer
+            manager.config.profile = tracer.enabled
+            self._caches_mtime = self._caches_file_mtime()
+        self.builds += 1
+        self.last_build = {
+            "ok": manager._counter.ok, "error": manager._counter.error,
+            "unchanged": manager._counter.unchanged,
+            "ms": (time() - start_at) * 1000, "at": start_at
+        }
+        return self.last_build
+
+    def clean(self) -> dict[str, Any]:
+        """Delete the files in the output folder whose original files do not exist.
+        The whole output folder is scanned."""
+        manager = self.prepare_manager()
+        manager._last_manifest = {}
+        manager.clean()
+        if manager.memory_outputs is None:
+            manager.caches.save(manager.caches_file)
+            self._caches_mtime = self._caches_file_mtime()
+        return {}
+
+    def status(self) -> dict[str, Any]:
+        "Get the state of the daemon."
+        return {
+            "pid": getpid(), "cwd": self.cwd, "config_file": self.config_file,
+            "started_at": self.started_at, "builds": self.builds,
+            "last_build": self.last_build,
+            "extensions": [] if self.manager is None else list(self.manager.extensions)
+        }
+
+    def handle(self, data: dict[str, Any]) -> dict[str, Any]:
+        """Handle the request.
+        The logs written to the console of the manager while handling it are put in ``output`` of the response.
+
+        Args:
+            data: The request."""
+        from rich.console import Console
+
+        if data.get("cwd", self.cwd) != self.cwd:
+            return {"ok": False, "output": "", "error": (
+                f"The daemon is running in {self.cwd!r}, not in {data['cwd']!r}."
+            )}
+        if data.get("config_file", self.config_file) != self.config_file:
+            return {"ok": False, "output": "", "error": (
+                f"The daemon uses {self.config_file!r}, not {data['config_file']!r}."
+            )}
+        self.console.log("Received:", data.get("command"), highlight=False)
+        buffer = StringIO()
+        console = Console(
+            file=buffer, force_terminal=bool(data.get("color")),
+            width=data.get("width") or 80
+        )
+        try:
+            match data.get("command"):
+                case "build":
+                    # ログをクライアントに送るために、出力先を変える。
+                    self.prepare_manager().console = console
+                    result = self.build(data.get("jobs"), data.get("profile"))
+                case "clean":
+                    self.prepare_manager().console = console
+                    result = self.clean()
+                case "status":
+                    result = self.status()
+                case "stop":
+                    self._running = False
+                    result = {}
+                case command:
+                    return {"ok": False, "output": "", "error": f"Unknown command: {command!r}"}
+        except Exception:
+            from traceback import format_exc
+            self.console.log("Failed:", data.get("command"), highlight=False)
+            return {"ok": False, "output": buffer.getvalue(), "error": format_exc()}
+        finally:
+            if self.manager is not None:
+                self.manager.console = self.console
+        return {"ok": True, "output": buffer.getvalue(), "result": result}
+
+    def serve_forever(self) -> None:
+        """Listen on the socket and handle requests until ``stop`` is requested.
+
+        Raises:
+            DaemonError: Unix domain sockets are not supported or another daemon is already running."""
+        if not hasattr(socket, "AF_UNIX"):
+            raise DaemonError("The daemon needs Unix domain sockets.")
+        if exists(self.path):
+            if request("status", self.path) is not None:
+                raise DaemonError(f"The daemon is already running: {self.path}")
+            # 前回のデーモンが残したソケットを消す。
+            remove(self.path)
+
+        from socketserver import UnixStreamServer, StreamRequestHandler
+        daemon = self
+
+        class Handler(StreamRequestHandler):
+            def handle(self) -> None:
+                if line := self.rfile.readline():
+                    self.wfile.write(f"{dumps(daemon.handle(loads(line)))}\n".encode())
+
+        self.prepare_manager()
+        with UnixStreamServer(self.path, Handler) as server:
+            self._running = True
+            try:
+                while self._running:
+                    server.handle_request()
+            finally:
+                remove(self.path)
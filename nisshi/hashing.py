@@ -0,0 +1,34 @@
+# nisshi - Hashing
+
+from pathlib import PurePath
+
+try:
+    from xxhash import xxh3_128 as _hash
+except ImportError:
+    from hashlib import blake2b
+    _hash = lambda data=b"": blake2b(data, digest_size=16) # type: ignore
+
+
+__all__ = ("digest", "file_digest")
+
+
+def digest(data: bytes | str) -> str:
+    """Make a fast digest of the passed data.
+
+    Args:
+        data: The data."""
+    if isinstance(data, str):
+        data = data.encode()
+    return _hash(data).hexdigest()
+
+
+def file_digest(path: PurePath | str) -> str:
+    """Make a fast digest of the contents of the file.
+
+    Args:
+        path: The path to the file."""
+    hash_ = _hash()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            hash_.update(chunk)
+    return hash_.hexdigest()
@@ -4,29 +4,114 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any
 
+from threading import Thread, Condition
+from time import monotonic
+
+from fnmatch import fnmatch
 from pathlib import PurePath
-from os.path import exists
+from os.path import exists, relpath
+from os import fsdecode
 
 from watchdog import events
 
-from .config import CURRENT
+from .config import CURRENT, Config
 
 if TYPE_CHECKING:
     from .manager import Manager
 
 
+__all__ = ("BuildQueue", "HotReloadFileEventHandler")
+
+
+class BuildQueue(Thread):
+    """ファイルの変更を一定時間集めてから、まとめてビルドするためのキューです。
+    同じパスのイベントは最後のものだけが処理されます。
+    ビルド中に新しいイベントが来た場合は、ファイル毎の区切りでそのビルドを中断し、残りを次のまとまりに回します。"""
+
+    def __init__(self, handler: HotReloadFileEventHandler, delay: float):
+        self.handler, self.delay = handler, delay
+        self.pending: dict[PurePath, tuple[str, bool]] = {}
+        self.condition = Condition()
+        self.running, self.last = True, 0.0
+        super().__init__(daemon=True)
+
+    def put(self, action: str, path: PurePath, is_directory: bool = False) -> None:
+        "イベントを追加します。`action`は`build`か`clean`です。"
+        with self.condition:
+            # 古いイベントは新しいもので置き換える。
+            self.pending.pop(path, None)
+            self.pending[path] = (action, is_directory)
+            self.last = monotonic()
+            self.condition.notify()
+
+    @property
+    def cancelled(self) -> bool:
+        "新しいイベントが来ていて、今のビルドを中断するべきかどうかです。"
+        return bool(self.pending)
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def _take(self) -> dict[PurePath, tuple[str, bool]]:
+        # 一定時間新しいイベントが来なくなるまで待ってから、イベントを取り出す。
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait()
+            while self.running and (remaining := self.last + self.delay - monotonic()) > 0:
+                self.condition.wait(remaining)
+            batch, self.pending = self.pending, {}
+        return batch
+
+    def run(self) -> None:
+        while self.running:
+            if not (batch := self._take()):
+                continue
+
+            items = list(batch.items())
+            self.handler.manager._batch = set()
+            self.handler.manager._changed_outputs = []
+            for index, (path, (action, is_directory)) in enumerate(items):
+                if self.cancelled:
+                    # 残りは新しいイベントと一緒に処理する。
+                    with self.condition:
+                        rest = dict(items[index:])
+                        rest.update(self.pending)
+                        self.pending = rest
+                    break
+                self.handler.process(action, path, is_directory)
+            self.handler.manager._batch = None
+
+            outputs = self.handler.manager._changed_outputs
+            self.handler.manager._changed_outputs = None
+            self.handler._wrap(
+                self.handler.manager.dispatch, "on_after_build_batch", outputs
+            )
+
+
 class HotReloadFileEventHandler(events.FileSystemEventHandler):
     """`Manager`クラスのホットリロード版ビルドを実装するために使用するファイル監視クラスです。
-    ファイルが変更され次第最適な処理を行います。"""
+    ファイルの変更は:class:`BuildQueue`に集められ、まとめて最適な処理が行われます。"""
 
-    def __init__(self, manager: Manager, *args: Any, **kwargs: Any):
+    def __init__(
+        self, manager: Manager, *args: Any,
+        config_file: str | None = None, **kwargs: Any
+    ):
         self.manager = manager
+        self.config_file = None if config_file is None \
+            else PurePath(relpath(config_file, CURRENT))
+        self._config = None if config_file is None \
+            else Config.from_file(config_file, True)
         super().__init__(*args, **kwargs)
         super(events.FileSystemEventHandler, self).__init__()
+        self.queue = BuildQueue(self, manager.config.hot_reload_delay)
+        self.queue.start()
 
-    def _relative(self, path: str) -> PurePath:
+    def _relative(self, path: str | bytes) -> PurePath:
         "パスをルートフォルダ(inputs等)とファイルのパスに分けます。"
-        return PurePath(path).relative_to(CURRENT)
+        # watchdogのイベントのパスは`bytes`のこともある。
+        return PurePath(relpath(fsdecode(path), CURRENT))
 
     def _wrap(self, func, *args, **kwargs):
         try:
@@ -34,19 +119,77 @@ class HotReloadFileEventHandler(events.FileSystemEventHandler):
         except Exception:
             self.manager._print_exception()
 
+    def dispatch(self, event: events.FileSystemEvent) -> None:
+        # 無視するファイルのイベントは処理しない。
+        for raw_path in (event.src_path, getattr(event, "dest_path", "")):
+            if raw_path and self.is_ignored(self._relative(raw_path)):
+                return
+        super().dispatch(event)
+
+    def is_ignored(self, path: PurePath) -> bool:
+        "渡されたパスのファイルの変更を無視するべきかどうかを返します。"
+        if path == self.config_file:
+            return False
+        # 設定ファイルのために監視しているフォルダのその他のファイルは無視する。
+        if len(path.parts) < 2:
+            return True
+        return any(
+            fnmatch(str(path), pattern) or fnmatch(path.name, pattern)
+            for pattern in self.manager.config.hot_reload_ignores
+        )
+
+    def process(self, action: str, path: PurePath, is_directory: bool) -> None:
+        "キューから取り出されたイベントを処理します。"
+        if path.parts and path.parts[0] == self.manager.config.script_folder:
+            # スクリプトは削除された場合も読み込み直す。
+            self._wrap(self._reload_extensions)
+        elif action == "clean":
+            self._wrap(self._clean, path, is_directory)
+        elif path == self.config_file:
+            self._wrap(self._reload_config)
+        elif exists(path):
+            self._wrap(self.manager.build, path)
+
+    def _reload_config(self) -> None:
+        "設定ファイルを読み込み直し、変更された設定を反映してからビルドし直します。"
+        assert self.config_file is not None and self._config is not None
+        config = Config.from_file(str(self.config_file), True)
+        # コマンドラインから設定されたもの等を上書きしないように、設定ファイルで変更されたものだけを反映する。
+        changed = {
+            key: value for key, value in config.items()
+            if self._config.get(key) != value
+        }
+        self._config = config
+        if not changed:
+            return
+
+        self.manager.config.update(changed)
+        self.manager._watch(self)
+        # 変更された設定を読んだページは、`build_all`でビルドし直される。
+        self.manager.build_all()
+
+    def _reload_extensions(self) -> None:
+        """スクリプトのフォルダのエクステンションを読み込み直します。
+        ページの出力結果を変えうるイベントリスナー等が変更された場合のみ、全てのページをビルドし直します。"""
+        folder = self.manager.config.script_folder
+        # 複数のスクリプトが変更された場合でも、まとめて一回だけ読み込み直す。
+        if self.manager._batch is not None:
+            if PurePath(folder) in self.manager._batch:
+                return
+            self.manager._batch.add(PurePath(folder))
+        if self.manager._reload_scripts():
+            self.manager.build_all(force_pages=True)
+
     def on_any_update(self, raw_path: str) -> None:
         "何かしら更新があった際に呼び出すべき関数です。"
-        if exists(raw_path):
-            self._wrap(self.manager.build, self._relative(raw_path))
+        self.queue.put("build", self._relative(raw_path))
 
     def on_created(self, event: events.DirCreatedEvent | events.FileCreatedEvent) -> None:
         if not event.is_directory:
             self.on_any_update(event.src_path)
 
-    def _clean(self, path_raw: str, is_directory: bool = False) -> None:
+    def _clean(self, path: PurePath, is_directory: bool = False) -> None:
         "渡されたパスのファイルの出力先にあるファイルを消す。"
-        path = self._relative(path_raw)
-
         try: path.parents[-2]
         except IndexError: return
 
@@ -57,19 +200,24 @@ class HotReloadFileEventHandler(events.FileSystemEventHandler):
             path.parents[-2].name != self.manager.config.input_folder
             or not path.suffix or path.suffix[1:] in self.manager.config.input_exts
         ):
-            self.manager._clean(path, self.manager.swap_path(
+            output_path = self.manager.swap_path(
                 PurePath(path), self.manager.config.output_folder,
-                None if is_directory else self.manager.config.output_ext
-            ), is_directory)
+                None if is_directory
+                    or path.parents[-2].name != self.manager.config.input_folder
+                    else self.manager.config.output_ext
+            )
+            # 一時ファイル等の出力先が存在しないものは無視する。
+            if self.manager.output_exists(output_path):
+                self.manager._clean(path, output_path, is_directory)
 
     def on_deleted(self, event: events.DirDeletedEvent | events.FileDeletedEvent) -> None:
-        self._wrap(self._clean, event.src_path, event.is_directory)
+        self.queue.put("clean", self._relative(event.src_path), event.is_directory)
 
     def on_modified(self, event: events.DirModifiedEvent | events.FileModifiedEvent) -> None:
         if not event.is_directory:
             self.on_any_update(event.src_path)
 
     def on_moved(self, event: events.DirMovedEvent | events.FileMovedEvent) -> None:
-        self._wrap(self._clean, event.src_path, event.is_directory)
+        self.queue.put("clean", self._relative(event.src_path), event.is_directory)
         if not event.is_directory:
-            self.on_any_update(event.dest_path)
\ No newline at end of file
+            self.on_any_update(event.dest_path)
@@ -0,0 +1,209 @@
+# nisshi - Isolation
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+from collections.abc import Iterator, Sequence
+
+from collections import deque
+from time import monotonic
+
+from pathlib import PurePath
+
+from .parallel import ProcessResult, _initialize, _process
+from .common import _color
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+
+    from .processor import Processor
+    from .manager import Manager
+
+
+__all__ = ("process_isolated",)
+
+
+def _limit_memory(limit: int) -> None:
+    # アドレス空間の大きさを制限する。`resource`が使えない環境では何もしない。
+    try:
+        import resource
+    except ImportError:
+        return
+    size = limit * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        size = min(size, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (size, hard))
+
+
+def _work(
+    connection: Connection, config: Any, caches: Any,
+    extensions: Sequence[str], memory_limit: int
+) -> None:
+    # ワーカープロセスで、送られてきた処理を一つずつ実行する。
+    if memory_limit > 0:
+        _limit_memory(memory_limit)
+    _initialize(config, caches, extensions)
+    connection.send(None)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        connection.send(_process(*task))
+
+
+class _Worker:
+    "監視されるワーカープロセスです。"
+
+    def __init__(self, manager: Manager, memory_limit: int):
+        from multiprocessing import Pipe, get_context
+
+        self.connection, child = Pipe()
+        self.process: BaseProcess = get_context().Process(target=_work, args=(
+            child, manager.config, manager.caches, tuple(manager.extensions), memory_limit
+        ), daemon=True)
+        self.process.start()
+        child.close()
+        self.task: int | None = None
+        self.deadline: float | None = None
+
+    def wait_ready(self) -> None:
+        # ワーカーの準備ができるまで待つ。
+        try:
+            self.connection.recv()
+        except EOFError:
+            self.kill()
+            raise RuntimeError(
+                "The worker process exited while starting. (exit code: %s)" % self.process.exitcode
+            ) from None
+
+    def send(self, index: int, task: tuple[Any, ...], timeout: float) -> None:
+        self.task = index
+        self.deadline = monotonic() + timeout if timeout > 0 else None
+        self.connection.send(task)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            ...
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+def _failed(
+    manager: Manager, processor_cls: type[Processor],
+    path: PurePath, directory: PurePath, error: Exception
+) -> ProcessResult:
+    # 止めたワーカーの処理の結果を作る。
+    manager.console.log(_color("bold", "red", "Killed"), str(error), highlight=False)
+    return ProcessResult(
+        False, None, processor_cls(manager, path, directory).make_output_path(),
+        error, False, {}, {}, []
+    )
+
+
+def process_isolated(
+    manager: Manager, processor_cls: type[Processor],
+    tasks: Sequence[tuple[PurePath, PurePath]], workers: int,
+    timeout: float = 0, memory_limit: int = 0
+) -> Iterator[tuple[tuple[PurePath, PurePath], ProcessResult]]:
+    """Run processors in supervised worker processes.
+    This is like :func:`.parallel.process_in_parallel`, but a worker process which takes longer than ``timeout`` seconds for a file or dies (e.g. because it ran out of memory) is killed and replaced with a new one.
+    Then the result of the file has a :class:`TimeoutError` or a :class:`RuntimeError` as its error.
+    The results are yielded in the order of ``tasks``.
+
+    Args:
+        manager: The manager whose configuration and caches are used by workers.
+        processor_cls: The class of the processor.
+        tasks: Pairs of the input path and the output directory.
+        workers: The number of worker processes.
+        timeout: The maximum number of seconds to process a file. If this is 0, there is no limit.
+        memory_limit: The maximum size of the address space of each worker process in megabytes.
+            It is set with :func:`resource.setrlimit`, so it is not used on platforms which do not support it. If this is 0, there is no limit."""
+    if not tasks:
+        return
+    from multiprocessing.connection import wait
+
+    pending = deque(enumerate(tasks))
+    results: dict[int, ProcessResult] = {}
+    slots: list[_Worker | None] = [None] * min(workers, len(tasks))
+    next_index = 0
+    try:
+        # 先に全てのワーカーを起動してから、準備ができるのを待つ。
+        for number in range(len(slots)):
+            slots[number] = _Worker(manager, memory_limit)
+        for worker in slots:
+            assert worker is not None
+            worker.wait_ready()
+
+        while pending or any(worker is not None and worker.task is not None for worker in slots):
+            # 空いているワーカーに処理を渡す。
+            for number, worker in enumerate(slots):
+                if not pending:
+                    break
+                if worker is None:
+                    worker = slots[number] = _Worker(manager, memory_limit)
+                    worker.wait_ready()
+                if worker.task is None:
+                    index, (path, directory) = pending.popleft()
+                    worker.send(index, (processor_cls, path, directory), timeout)
+
+            busy = [worker for worker in slots if worker is not None and worker.task is not None]
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            ready = wait(
+                [worker.connection for worker in busy],
+                max(0, min(deadlines) - monotonic()) if deadlines else None
+            )
+
+            for worker in busy:
+                assert worker.task is not None
+                path, directory = tasks[worker.task]
+                if worker.connection in ready:
+                    try:
+                        results[worker.task] = worker.connection.recv()
+                    except (EOFError, OSError):
+                        # ワーカーが落ちた場合は、エラーとして扱う。
+                        worker.kill()
+                        slots[slots.index(worker)] = None
+                        results[worker.task] = _failed(
+                            manager, processor_cls, path, directory, RuntimeError(
+                                "The worker process exited while processing %s. (exit code: %s)"
+                                % (path, worker.process.exitcode)
+                            )
+                        )
+                    worker.task = None
+                elif worker.deadline is not None and monotonic() >= worker.deadline:
+                    # 時間がかかりすぎている場合は、ワーカーごと止める。
+                    worker.kill()
+                    slots[slots.index(worker)] = None
+                    results[worker.task] = _failed(
+                        manager, processor_cls, path, directory, TimeoutError(
+                            "Processing %s took longer than %s seconds." % (path, timeout)
+                        )
+                    )
+                    worker.task = None
+
+            # 結果を順番に返す。
+            while next_index in results:
+                yield tasks[next_index], results.pop(next_index)
+                next_index += 1
+    finally:
+        for worker in slots:
+            if worker is not None:
+                if worker.task is None:
+                    worker.close()
+                else:
+                    worker.kill()
@@ -4,33 +4,39 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, TypeVar, TypeAlias, Any
 from types import ModuleType
-from collections.abc import Callable, Iterable
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
 
 from importlib import import_module
 from dataclasses import dataclass
 
 from pathlib import PurePath
-from os import walk, mkdir
-from os.path import exists
+from os import walk, cpu_count, makedirs, remove
+from os.path import exists, splitext, join, relpath
 
 from time import time, sleep
+import sys
 
-from tempylate import Manager as TempylateManager, Template
 
 from rich.console import Console
-from rich.traceback import Traceback
 
-from watchdog.observers import Observer
-
-from .caches import Caches
-from .hot_reload import HotReloadFileEventHandler
+from .caches import Caches, SQLiteCaches, LRUCache, get_cache_directory
+from .outputs import MemoryOutputs
+from .tracing import Tracer
+from .template import TemplateManager
 from .common import Context, _green
 from .processor import Processor, RenderProcessor, IncludeProcessor, get_target_directory
-from .tools import OSTools, EventTool
-from .markdown import markdown
-from .config import Config
+from .parallel import ProcessResult, process_in_parallel
+from .tools import OSTools, EventTool, PAGE_EVENTS, fingerprint
+from .hashing import digest
+from .compression import ENCODINGS, available_encodings, compress_file, sidecar_path
+from .shard import shard_of, shard_caches_file, find_shard_caches_files
+from .snapshot import Snapshot
+from .sync import sync_file
+from .config import Config, record_reads, _DEPENDENCY_PREFIX
 
 if TYPE_CHECKING:
+    from watchdog.observers.api import BaseObserver
+    from .hot_reload import HotReloadFileEventHandler
     from .waste_checker import WasteChecker
     from .page import Page
 
@@ -43,15 +49,15 @@ class Counter():
 
     ok: int = 0
     error: int = 0
+    unchanged: int = 0
     stop: bool = True
 
     def reset(self) -> None:
+        self.ok = self.error = self.unchanged = 0
         self.stop = False
-        for name in self.__annotations__.keys():
-            setattr(self, name, 0)
 
     def sum_(self) -> int:
-        return sum(map(lambda n: getattr(self, n), self.__annotations__.keys()))
+        return self.ok + self.error
 
 
 class Manager(OSTools, EventTool):
@@ -60,12 +66,12 @@ class Manager(OSTools, EventTool):
     Args:
         config: An instance of :class:`config.Config` where the configuration is stored.
         caches: Instance of :class:`config.config` where the cache is stored.
-        *args: Arguments to be passed to the constructor of the template engine's class for template management (:class:`tempylate.manager.Manager`).
+        *args: Arguments to be passed to the constructor of the template engine's class for template management (:class:`.template.TemplateManager`).
         waste_checker_args: Arguments without Manager's instance to be passed to the constructor of the waste checker.
         waste_checker_kwargs: Keyword arguments to be passed to the constructor of the waste checker.
-        **kwargs: Keyword arguments to be passed to the constructor of the template engine's class for template management (:class:`tempylate.manager.Manager`)."""
+        **kwargs: Keyword arguments to be passed to the constructor of the template engine's class for template management (:class:`.template.TemplateManager`)."""
 
-    observer: Observer | None
+    observer: BaseObserver | None
     if TYPE_CHECKING:
         page_cls: TypeAlias = Page
         """This is :class:`Page`.
@@ -83,35 +89,77 @@ class Manager(OSTools, EventTool):
         **kwargs: Any
     ):
         self.config = config or Config()
+        self.tracer = Tracer(self.config.profile)
+        "The tracer which records how long each phase of a build takes. It is enabled by :attr:`.config.Config.profile`."
         self.waste_checker = self.waste_checker_cls(
             self, *waste_checker_args, **(waste_checker_kwargs or {})
         )
         self.waste_checker.manager = self
         self.console: Console = Console(quiet=True)
-
-        self.caches = caches or Caches.from_file(self.config.caches_file)
+        self.memory_outputs: MemoryOutputs | None = \
+            MemoryOutputs() if self.config.in_memory else None
+        "The output files kept in memory. This is ``None`` unless :attr:`.config.Config.in_memory` is enabled."
+        self.snapshot: Snapshot | None = None
+        "The snapshot of the folders used while :meth:`.build_all` is running. See :class:`.snapshot.Snapshot`."
+
+        self.caches_file = self.config.caches_file if self.config.shard_count <= 1 \
+            else shard_caches_file(
+                self.config.caches_file, self.config.shard_index, self.config.shard_count
+            )
+        "The path to the cache file. It is the file for the shard if the build is sharded."
+        self.caches = caches or (
+            self._load_shard_caches() if self.config.shard_count > 1 else (
+                SQLiteCaches if self.config.caches_backend == "sqlite" else Caches
+            ).from_file(self.caches_file)
+        )
         self.ctx: Context[Any] = Context()
         self._counter = Counter()
 
         self._last = ("", 0.0)
         self._updated_layouts: set[PurePath] = set()
-
-        self.tempylate = TempylateManager[Template](*args, **kwargs)
+        self._changed_fingerprint: set[str] | None = None
+        self._extension_config_reads: set[str] = set()
+        self._last_manifest: dict[str, list[str]] = {}
+        self._recorded: set[str] = set()
+        self._batch: set[PurePath] | None = None
+        self._changed_outputs: list[PurePath] | None = None
+
+        self.tempylate = TemplateManager(*args, compiled=LRUCache(
+            self.config.template_cache_size,
+            get_cache_directory(self.config.caches_file, "templates")
+                if self.config.persistent_caches else None,
+            self.config.persistent_cache_size
+        ), **kwargs)
+        self.markdown_caches = LRUCache[str](
+            self.config.markdown_cache_size,
+            get_cache_directory(self.config.caches_file, "markdown")
+                if self.config.persistent_caches else None,
+            self.config.persistent_cache_size
+        )
         self.is_building_all = False
 
         super().__init__(self)
         super(OSTools, self).__init__(self)
 
         self.extensions: dict[str, ModuleType] = {}
+        self._extension_classes: dict[str, dict[str, Any]] = {}
         for name in self.config.extensions:
             self.load_extension(name)
 
     def markdown(self, text: str) -> str:
         """Convert markdown to html.
+        The result is cached by the markdown and the markdown backend.
 
         Args:
             text: The markdown."""
-        return markdown(text)
+        # 起動を速くするために、マークダウンのライブラリは使う時に読み込む。
+        from .markdown import markdown, BACKEND, VERSION
+        key = digest(f"{BACKEND}\0{VERSION}\0{text}")
+        if (html := self.markdown_caches.get(key)) is None:
+            with self.tracer.span("markdown", "markdown"):
+                html = markdown(text)
+            self.markdown_caches.set(key, html)
+        return html
 
     def load_extension(self, name: str) -> None:
         """Load the extension.
@@ -123,19 +171,159 @@ class Manager(OSTools, EventTool):
             This will import the specified one.
             It then executes the function `setup`, if present, passing an instance of this class.
             If you are making a third-party library for NISSHI, make it so that you can load it with this."""
-        self.extensions[name] = import_module(name)
-        if hasattr(self.extensions[name], "setup"):
-            self.extensions[name].setup(self)
+        self._setup_extension(name, lambda: import_module(name))
+
+    def _setup_extension(self, name: str, get_module: Callable[[], ModuleType]) -> None:
+        # エクステンションで追加されたものがわかるように記録しながら、エクステンションを読み込む。
+        classes = {key: getattr(Manager, key) for key in _REPLACEABLE}
+        before, self._extension = self._extension, name
+        try:
+            # 読み込む時に使われた設定は、全てのページの出力結果を変えうるので記録しておく。
+            with record_reads(self._extension_config_reads):
+                self.extensions[name] = get_module()
+                if hasattr(self.extensions[name], "setup"):
+                    self.extensions[name].setup(self)
+        finally:
+            self._extension = before
+            # `page_cls`等が置き換えられた場合は、元に戻せるように記録しておく。
+            if replaced := {
+                key: value for key, value in classes.items()
+                if getattr(Manager, key) is not value
+            }:
+                self._extension_classes[name] = replaced
+
+    def unload_extension(self, name: str) -> None:
+        """Unload the extension loaded by :meth:`.load_extension`.
+        If it has the function ``teardown``, it is executed by passing an instance of this class.
+        Then the event listeners and the bundles added while loading it are removed and the classes replaced by it (e.g. :attr:`.page_cls`) are restored.
+        The module and its submodules are removed from :data:`sys.modules`, so it is imported again when it is loaded next time.
+
+        Args:
+            name: The name of the extension.
+
+        Raises:
+            KeyError: The extension is not loaded."""
+        module = self.extensions.pop(name)
+        if hasattr(module, "teardown"):
+            module.teardown(self)
+        self._forget_extension(name)
+
+    def _forget_extension(self, name: str) -> None:
+        # エクステンションで追加されたものを消す。
+        self._remove_extension_listeners(name)
+        for key, value in self._extension_classes.pop(name, {}).items():
+            setattr(Manager, key, value)
+        for module_name in tuple(sys.modules):
+            if module_name == name or module_name.startswith(f"{name}."):
+                del sys.modules[module_name]
+
+    def reload_extension(self, name: str) -> None:
+        """Unload the extension with :meth:`.unload_extension` and load it again.
+        If loading the new one fails, the old one is loaded again and the error is raised.
+
+        Args:
+            name: The name of the extension.
+
+        Raises:
+            KeyError: The extension is not loaded."""
+        old = self.extensions[name]
+        modules = {
+            module_name: module for module_name, module in sys.modules.items()
+            if module_name == name or module_name.startswith(f"{name}.")
+        }
+        self.unload_extension(name)
+        try:
+            self.load_extension(name)
+        except Exception:
+            # 読み込みに失敗した場合は、途中まで追加されたものを消して元に戻す。
+            self.extensions.pop(name, None)
+            self._forget_extension(name)
+            sys.modules.update(modules)
+            self._setup_extension(name, lambda: old)
+            raise
+
+    def _reload_scripts(self) -> bool:
+        "スクリプトのフォルダのエクステンションを読み込み直し、ページの出力結果が変わりうるかを返します。"
+        folder = self.config.script_folder
+        names = [
+            name for name in self.extensions
+            if name == folder or name.startswith(f"{folder}.")
+        ]
+        if not names and not exists(folder):
+            return False
+
+        before = self._page_digest()
+        if names:
+            for name in names:
+                self.reload_extension(name)
+        else:
+            self.load_extension(folder)
+        self.console.log("{} {}".format(_green("Reloaded"), ", ".join(names or (folder,))))
+        return self._page_digest() != before
+
+    def _page_digest(self) -> str:
+        # ページの出力結果を変えうるイベントリスナーやクラスのダイジェストを作る。
+        return digest("\0".join((
+            self.digest_listeners(PAGE_EVENTS),
+            *(fingerprint(getattr(Manager, key)) for key in _REPLACEABLE)
+        )))
+
+    def _make_fingerprint(self) -> dict[str, str]:
+        """出力結果を変えうるもののダイジェストを作ります。
+        設定は項目ごとに`config:metadata`のようなキーで作ります。"""
+        from tempylate import __version__ as tempylate_version
+        from . import __version__
+
+        fingerprint = {
+            "nisshi": __version__, "tempylate": tempylate_version,
+            "markdown": _get_markdown_backend(), "extensions": self._page_digest()
+        }
+        for key, value in self.config.items():
+            fingerprint[f"{_DEPENDENCY_PREFIX}{key}"] = digest(repr(value))
+        return fingerprint
+
+    @property
+    def changed_fingerprint(self) -> set[str]:
+        """The keys of :attr:`.caches.Caches.fingerprint` whose values have been changed since the last :meth:`.build_all`. (e.g. ``config:metadata``)
+        Pages which read the changed settings while being built (see :meth:`.page.Page.record_config`) are rebuilt.
+        If the others (e.g. ``extensions``) or the settings read while loading extensions are changed, all the pages are rebuilt."""
+        if self._changed_fingerprint is None:
+            # ワーカープロセスでは、親プロセスから渡されたキャッシュと比べて調べる。
+            self._changed_fingerprint = {
+                key for key, value in self._make_fingerprint().items()
+                if self.caches.fingerprint.get(key) != value
+            }
+        return self._changed_fingerprint
+
+    def _is_all_pages_outdated(self) -> bool:
+        "前回のビルドから、全てのページの出力結果を変えうるものが変わったかを返します。"
+        return any(
+            not key.startswith(_DEPENDENCY_PREFIX)
+            or key[len(_DEPENDENCY_PREFIX):] in self._extension_config_reads
+            for key in self.changed_fingerprint
+        )
 
     def _print_exception(self) -> None:
         __import__("traceback").print_exc()
         return
+        from rich.traceback import Traceback
         self.console.log(Traceback(
             show_locals=self.manager.config.debug_mode,
             max_frames=100 if self.manager.config.debug_mode else 1
         ))
 
     def build(self, path: PurePath, force: bool = False) -> None:
+        """Build the file of the passed path.
+        Pages which depend on the file (e.g. the file is a layout) are also rebuilt.
+
+        Args:
+            path: The relative path to the file.
+            force: Whether to build even if the file has already been built."""
+        if self._batch is not None:
+            # まとめてビルドしている場合は、既にビルドしたものはビルドしない。
+            if path in self._batch:
+                return
+            self._batch.add(path)
         self.dispatch("on_build", path)
         before = self.config.force_build
         self.config.force_build = force
@@ -145,7 +333,11 @@ class Manager(OSTools, EventTool):
         except IndexError:
             return
         if path.parents[-2].name == self.manager.config.layout_folder:
-            self.manager.build_all()
+            if self.caches.dependencies:
+                self._build_dependents(path)
+            else:
+                # 依存関係がまだ記録されていない場合は、全てをビルドし直す。
+                self.manager.build_all()
         else:
             processor: Processor
             directory = self.manager.swap_path(path.parent, self.manager.config.output_folder)
@@ -156,70 +348,347 @@ class Manager(OSTools, EventTool):
                     processor = RenderProcessor(self.manager, path, directory)
                 case _:
                     return
-            processor.start()
-    
+            if type(processor)._parallel and self.config.isolated_render:
+                # 暴走したページでホットリロードが止まらないように、監視されたワーカープロセスでビルドする。
+                self._build_in_parallel(type(processor), 1, ((path, directory),))
+            elif type(processor)._parallel and self.config.async_build:
+                # `await`を使うテンプレートもあるので、`build_all`と同じように非同期でビルドする。
+                import asyncio
+                asyncio.run(processor.aiostart())
+            else:
+                processor.start()
+            self._build_dependents(path)
+
         self.config.force_build = before
 
+    def _build_dependents(self, path: PurePath) -> None:
+        "渡されたパスのテンプレートに依存しているページをビルドし直します。"
+        if (raw_path := str(path)) in self.caches.dependents \
+                and self.waste_checker.judge(path, None) is not None:
+            for page_path in tuple(self.caches.dependents[raw_path]):
+                self.build(PurePath(page_path), True)
+
     def _build(self, processor_cls: type[Processor]) -> None:
         "指定された過程でのビルドを実行します。"
+        workers = self.config.workers or cpu_count() or 1
+        if processor_cls._parallel and self.config.isolated_render:
+            self._build_in_parallel(processor_cls, workers)
+            return
+        if processor_cls._parallel and self.config.async_build:
+            import asyncio
+            asyncio.run(self._aiobuild(processor_cls))
+            return
+        if processor_cls._parallel and workers > 1:
+            self._build_in_parallel(processor_cls, workers)
+            return
+
         for path, directory in self.walk_for_build(
             get_target_directory(processor_cls, self)
         ):
             processor = processor_cls(self, path, directory)
             if processor.start():
                 self._counter.ok += 1
+                if not processor.written:
+                    self._counter.unchanged += 1
             elif processor.error is not None:
                 self._counter.error += 1
 
-    def build_all(self) -> int:
-        "Build what is in the source folder."
+    async def _aiobuild(self, processor_cls: type[Processor]) -> None:
+        "指定された過程でのビルドを非同期で並行して実行します。"
+        from asyncio import Semaphore, gather
+        semaphore = Semaphore(max(1, self.config.concurrency))
+
+        async def run(path: PurePath, directory: PurePath) -> None:
+            async with semaphore:
+                processor = processor_cls(self, path, directory)
+                if await processor.aiostart():
+                    self._counter.ok += 1
+                    if not processor.written:
+                        self._counter.unchanged += 1
+                elif processor.error is not None:
+                    self._counter.error += 1
+
+        directories = self._walk_directories(get_target_directory(processor_cls, self))
+        if self.listeners.get("on_before_build_directory") \
+                or self.listeners.get("on_after_build_directory"):
+            # フォルダのイベントがそのフォルダのファイルの処理を挟むように、フォルダごとに並行して処理する。
+            for current, current_output, paths in directories:
+                await self.aiodispatch("on_before_build_directory", current, current_output)
+                await gather(*(run(path, current_output) for path in paths))
+                await self.aiodispatch("on_after_build_directory", current, current_output)
+        else:
+            await gather(*(
+                run(path, current_output)
+                for _, current_output, paths in directories for path in paths
+            ))
+
+    def _build_in_parallel(
+        self, processor_cls: type[Processor], workers: int,
+        tasks: Sequence[tuple[PurePath, PurePath]] | None = None
+    ) -> None:
+        """指定された過程でのビルドをワーカープロセスで実行します。
+        `isolated_render`が有効な場合は、監視されたワーカープロセスで実行します。
+        `on_before_build_directory`等のイベントは、そのフォルダのファイルの結果を反映する前後で呼びます。"""
+        directories: tuple[tuple[PurePath, PurePath, list[PurePath]], ...] = ()
+        if tasks is None:
+            directories = tuple(self._walk_directories(get_target_directory(processor_cls, self)))
+            tasks = tuple(
+                (path, current_output)
+                for _, current_output, paths in directories for path in paths
+            )
+        if self.config.isolated_render:
+            from .isolation import process_isolated
+            results = process_isolated(
+                self, processor_cls, tasks, workers,
+                self.config.page_timeout, self.config.page_memory_limit
+            )
+        else:
+            results = process_in_parallel(self, processor_cls, tasks, workers)
+        if directories:
+            results = self._wrap_directory_events(directories, results)
+        for (path, directory), result in results:
+            # ワーカーでの結果を反映させる。
+            self.caches.merge(result.caches)
+            processor = processor_cls(self, path, directory)
+            processor.output_path, processor.error = result.output_path, result.error
+            if result.output_path is not None:
+                self._record_output(path, result.output_path)
+                # ワーカーで書き込まれたファイルをスナップショットに反映させる。
+                if self.snapshot is not None and self.memory_outputs is None:
+                    if result.done:
+                        self.snapshot.add_directory(directory)
+                    self.snapshot.refresh(result.output_path)
+            if self.memory_outputs is not None:
+                self.memory_outputs.update(result.outputs)
+            self.tracer.merge(result.trace)
+            processor.update = result.update # type: ignore
+            processor.written = result.written
+            if result.done:
+                processor.on_success()
+                self._counter.ok += 1
+                if processor.written:
+                    self._report_output(processor.output_path)
+                else:
+                    self._counter.unchanged += 1
+            elif result.error is not None:
+                processor.on_error(result.error)
+                self._counter.error += 1
+                # 止められた場合等に古い出力結果が残らないようにする。
+                if processor.output_path is not None and self.output_exists(processor.output_path):
+                    self.remove(processor.output_path)
+
+    def _wrap_directory_events(
+        self, directories: Iterable[tuple[PurePath, PurePath, list[PurePath]]],
+        results: Iterable[tuple[tuple[PurePath, PurePath], ProcessResult]]
+    ) -> Iterator[tuple[tuple[PurePath, PurePath], ProcessResult]]:
+        "順番に返される結果を、フォルダごとに`on_before_build_directory`と`on_after_build_directory`で挟みます。"
+        iterator = iter(results)
+        for current, current_output, paths in directories:
+            self.dispatch("on_before_build_directory", current, current_output)
+            for _ in paths:
+                yield next(iterator)
+            self.dispatch("on_after_build_directory", current, current_output)
+
+    def build_all(self, force_pages: bool = False) -> int:
+        """Build what is in the source folder.
+
+        Args:
+            force_pages: Whether to rebuild all the pages even if they have not been changed.
+                It is used when the extensions which can change the pages are reloaded.
+                The files in the include folder are not copied again."""
         self.is_building_all = True
         self.dispatch("on_before_build_all")
         self.console.log("Building all...", highlight=False)
 
-        if not exists(self.config.output_folder):
-            mkdir(self.config.output_folder)
+        self.mkdir_if_not_exists(PurePath(self.config.output_folder))
 
         count, start_at = 0, time()
         self._counter.reset()
         self._updated_layouts = set()
-
-        # ソースフォルダにある全てまたは渡されたパスのファイルのビルドをする。
-        with self.console.status("[bold blue]Building...", spinner="bouncingBar") as status:
-            self._build(RenderProcessor)
-            self._build(IncludeProcessor)
-
-            # 何個処理をしたか表示する。
-            self.console.log("[bold blue]{} files were processed in {:.4f}ms.".format(
-                self._counter.sum_(), (time() - start_at) / 1000
-            ))
-            if self._counter.error:
-                self.console.log(
-                    "[bold red]But %s files were made errors but were ignored."
-                    % self._counter.error
-                )
-
-            # オリジナルが存在しないファイルを消す。
-            status.status = "[bold blue]Cleaning..."
-            status.update()
-            self.clean()
-
-            # キャッシュをセーブする。
-            status.status = "[bold blue]Saving caches..."
-            status.update()
-            self.caches.save(self.config.caches_file)
+        self._last_manifest = dict(self.caches.manifest)
+        self._recorded = set()
+
+        # 前回のビルドから出力結果を変えうるものが変わったかを調べる。
+        # 設定の場合は、それを読んだページだけをビルドし直す。それ以外の場合は、全てのページをビルドし直す。
+        with self.tracer.span("fingerprint"):
+            fingerprint = self._make_fingerprint()
+            self._changed_fingerprint = {
+                key for key, value in fingerprint.items()
+                if self.caches.fingerprint.get(key) != value
+            }
+
+        # 何度もファイルの情報をOSに問い合わせないように、フォルダの中身を一度に調べておく。
+        with self.tracer.span("scan"):
+            self.snapshot = Snapshot(
+                self.config[f"{name}_folder"] for name in ("input", "include", "layout", "output")
+                if name != "output" or self.memory_outputs is None
+            )
+        try:
+            # ソースフォルダにある全てまたは渡されたパスのファイルのビルドをする。
+            with self.console.status("[bold blue]Building...", spinner="bouncingBar") as status, \
+                    self.tracer.span("build_all"):
+                with self.tracer.span("render"):
+                    before, self.config.force_build = \
+                        self.config.force_build, self.config.force_build or force_pages
+                    try:
+                        self._build(RenderProcessor)
+                    finally:
+                        self.config.force_build = before
+                # 次回のビルドで比べられるように、今回のものを記録しておく。
+                for key in tuple(self.caches.fingerprint):
+                    if key not in fingerprint:
+                        del self.caches.fingerprint[key]
+                self.caches.fingerprint.update(fingerprint)
+                self._changed_fingerprint = set()
+                with self.tracer.span("include"):
+                    self._build(IncludeProcessor)
+
+                # 何個処理をしたか表示する。
+                self.console.log("[bold blue]{} files were processed in {:.4f}ms.".format(
+                    self._counter.sum_(), (time() - start_at) * 1000
+                ))
+                if self._counter.unchanged:
+                    self.console.log(
+                        "[bold blue]%s outputs were unchanged and were not written."
+                        % self._counter.unchanged
+                    )
+                if self._counter.error:
+                    self.console.log(
+                        "[bold red]But %s files were made errors but were ignored."
+                        % self._counter.error
+                    )
+
+                # オリジナルが存在しないファイルを消す。
+                # 分割してビルドしている場合は、他のシャードの出力結果を消さないように`merge_shards`でする。
+                if self.config.shard_count <= 1:
+                    status.status = "[bold blue]Cleaning..."
+                    status.update()
+                    with self.tracer.span("clean"):
+                        self.clean()
+
+                # 出力先のファイルを圧縮したファイルを作る。
+                if self.config.compress and self.memory_outputs is None:
+                    status.status = "[bold blue]Compressing..."
+                    status.update()
+                    with self.tracer.span("compress"):
+                        self.compress()
+
+                # キャッシュをセーブする。
+                # メモリ上に出力している場合は、キャッシュをセーブしない。
+                if self.memory_outputs is None:
+                    status.status = "[bold blue]Saving caches..."
+                    status.update()
+                    with self.tracer.span("save caches"):
+                        self.caches.save(self.caches_file)
+        finally:
+            self.snapshot = None
 
         self.is_building_all = False
         self.dispatch("on_after_build_all")
         return count
 
-    def build_hot_reload(self, other_task: Callable[[], Any] = lambda: sleep(1)) -> None:
+    def _load_shard_caches(self) -> Caches:
+        """シャードのキャッシュを読み込みます。
+        シャードのキャッシュがまだない場合は、分割していないビルドのキャッシュからこのシャードのものを取り出して使う。
+        CI等で前回のキャッシュを復元してから分割してビルドした場合に、全てをビルドし直さないようにするためです。"""
+        sqlite = self.config.caches_backend == "sqlite"
+        cls = SQLiteCaches if sqlite else Caches
+        ext = ".sqlite3" if sqlite else splitext(self.config.caches_file)[1]
+        main_file = f"{splitext(self.config.caches_file)[0]}{ext}"
+        if exists(f"{splitext(self.caches_file)[0]}{ext}") or not exists(main_file):
+            return cls.from_file(self.caches_file)
+        main = SQLiteCaches(main_file) if sqlite else Caches.from_file(main_file)
+
+        # このシャードのファイルとその出力先のものと、レイアウト等の分割されないファイルのものを取り出す。
+        # 他のシャードのものまで入れると、`merge_shards`で古いもので上書きしてしまう。
+        sharded = (
+            self.config.input_folder, self.config.include_folder, self.config.output_folder
+        )
+        keys = set()
+        for raw_path, outputs in main.manifest.items():
+            if shard_of(raw_path, self.config.shard_count) == self.config.shard_index:
+                keys.add(raw_path)
+                keys.update(outputs)
+        for name, section in main.items():
+            if isinstance(section, Mapping) and name not in ("dependents", "fingerprint"):
+                keys.update(key for key in section if PurePath(key).parts[0] not in sharded)
+
+        caches = cls.from_file(self.caches_file)
+        caches.merge(main.extract(keys))
+        caches.fingerprint.update(main.fingerprint)
+        return caches
+
+    def merge_shards(self, directories: Iterable[str] = ()) -> None:
+        """Combine the results of the sharded builds (:attr:`.config.Config.shard_count`) and clean the output folder.
+        The caches of the shards are merged into the cache of this manager and the cache files of the shards in the current folder are deleted.
+        Then the outputs whose inputs no longer exist are deleted.
+
+        Args:
+            directories: The paths to the folders where the sharded builds were run (e.g. downloaded artifacts of CI).
+                Their output folders are copied to the output folder and their cache files of the shards are also merged.
+                The cache files of the shards in the current folder are always merged."""
+        self.console.log("Merging shards...", highlight=False)
+        self._last_manifest = dict(self.caches.manifest)
+        sqlite = self.config.caches_backend == "sqlite"
+        ext = ".sqlite3" if sqlite else None
+
+        files = find_shard_caches_files(self.config.caches_file, ext)
+        for directory in directories:
+            # シャードの出力結果をコピーする。
+            for current, _, names in walk(join(directory, self.config.output_folder)):
+                destination = join(
+                    self.config.output_folder,
+                    relpath(current, join(directory, self.config.output_folder))
+                )
+                makedirs(destination, exist_ok=True)
+                for name in names:
+                    sync_file(join(current, name), join(destination, name))
+            files.extend(find_shard_caches_files(
+                join(directory, self.config.caches_file), ext
+            ))
+
+        for path in files:
+            shard = SQLiteCaches(path) if sqlite else Caches.from_file(path)
+            self.caches.merge({
+                name: dict(section) for name, section in shard.items()
+                if isinstance(section, Mapping) and name != "dependents"
+            })
+            self.console.log("{} {}".format(_green("Merged"), path))
+
+        # 入力元が存在するものだけを今回のビルドの結果とする。
+        self._recorded = {
+            raw_input_path for raw_input_path in self.caches.manifest
+            if exists(raw_input_path)
+        }
+        self.clean()
+        if self.config.compress and self.memory_outputs is None:
+            self.compress()
+        self.caches.save(self.caches_file)
+
+        # 統合したので、このフォルダのシャードのキャッシュは消す。
+        for path in find_shard_caches_files(self.config.caches_file, ext):
+            for suffix in ("", "-wal", "-shm"):
+                if exists(path + suffix):
+                    remove(path + suffix)
+
+    def build_hot_reload(
+        self, other_task: Callable[[], Any] = lambda: sleep(1),
+        config_file: str | None = None
+    ) -> None:
         """Automatically run :meth:`.build` on file changes in the source folder.
+        Changes are gathered for :attr:`.config.Config.hot_reload_delay` seconds and built in one batch.
+        Only the input, include, layout and script folders and the configuration file are watched.
 
         Args:
-            other_task: Another program to run during file monitoring."""
+            other_task: Another program to run during file monitoring.
+            config_file: The path to the configuration file.
+                If this is passed, everything is rebuilt with the new configuration when the file is changed."""
+        # ホットリロードをしない場合は必要ないので、ここで読み込む。
+        from watchdog.observers import Observer
+        from .hot_reload import HotReloadFileEventHandler
         self.observer = Observer()
-        self.observer.schedule(HotReloadFileEventHandler(self), "./", recursive=True)
+        handler = HotReloadFileEventHandler(self, config_file=config_file)
+        self._watch(handler)
         self.observer.start()
         try:
             while True:
@@ -227,12 +696,92 @@ class Manager(OSTools, EventTool):
         finally:
             self.observer.stop()
             self.observer.join()
+            handler.queue.stop()
+
+    def _watch(self, handler: HotReloadFileEventHandler) -> None:
+        "監視するフォルダを設定します。"
+        assert self.observer is not None
+        self.observer.unschedule_all()
+        for folder in (
+            self.config.input_folder, self.config.include_folder,
+            self.config.layout_folder, self.config.script_folder
+        ):
+            if exists(folder):
+                self.observer.schedule(handler, folder, recursive=True)
+        if handler.config_file is not None:
+            self.observer.schedule(
+                handler, str(handler.config_file.parent), recursive=False
+            )
+
+    def _report_output(self, output_path: PurePath | None) -> None:
+        "出力先のファイルが変更されたことを記録します。ホットリロードの際に使われます。"
+        if self._changed_outputs is not None and output_path is not None:
+            self._changed_outputs.append(output_path)
+
+    def _record_output(self, input_path: PurePath, output_path: PurePath) -> None:
+        """Record the output of the input to the output manifest.
+        This is called by processors."""
+        raw_input_path = str(input_path)
+        self._recorded.add(raw_input_path)
+        self.caches.manifest[raw_input_path] = [str(output_path)]
 
     def clean(self) -> None:
-        "Delete unwanted files in the output folder."
-        for raw_current_output, _, raw_output_paths in walk(self.config.output_folder):
+        """Delete unwanted files in the output folder.
+        The files are found from the difference between the output manifest of the last build and the current one.
+        If :attr:`.config.Config.full_clean` is enabled or there is no manifest, the whole output folder is scanned instead."""
+        if self.config.full_clean or not self._last_manifest:
+            self._clean_by_scan()
+            return
+
+        for raw_input_path, raw_output_paths in self._last_manifest.items():
+            if raw_input_path in self._recorded:
+                current = self.caches.manifest.get(raw_input_path, ())
+                for raw_output_path in raw_output_paths:
+                    # 出力先が変わった場合は、古い出力結果を消す。
+                    if raw_output_path not in current \
+                            and self.output_exists(PurePath(raw_output_path)):
+                        self._clean(None, PurePath(raw_output_path), False)
+            else:
+                # オリジナルが存在しない出力結果を消す。
+                for raw_output_path in raw_output_paths:
+                    if self.output_exists(PurePath(raw_output_path)):
+                        self._clean(PurePath(raw_input_path), PurePath(raw_output_path), False)
+                self.caches.manifest.pop(raw_input_path, None)
+
+    def compress(self) -> None:
+        """Make the precompressed files of the output files in the encodings of :attr:`.config.Config.compress`.
+        This is done in threads and only the output files changed since the precompressed files were made are compressed."""
+        from concurrent.futures import ThreadPoolExecutor
+        encodings = available_encodings(self.config.compress)
+        exts = {f".{ext}" for ext in self.config.compress_exts}
+        tasks = [
+            (raw_output_path, encoding)
+            for raw_output_paths in self.caches.manifest.values()
+            for raw_output_path in raw_output_paths
+            if splitext(raw_output_path)[1] in exts and self.exists(raw_output_path)
+            for encoding in encodings
+        ]
+        with ThreadPoolExecutor() as executor:
+            count = sum(executor.map(lambda task: compress_file(*task), tasks))
+        if count:
+            self.console.log("[bold blue]%s precompressed files were made." % count)
+
+    def _clean_by_scan(self) -> None:
+        "出力先のフォルダを全て調べて、オリジナルが存在しないファイルを消します。"
+        for raw_current_output, raw_output_paths in (
+            self.memory_outputs.walk(self.config.output_folder)
+            if self.memory_outputs is not None
+            else self.snapshot.walk(self.config.output_folder)
+            if self.snapshot is not None
+            else ((current, paths) for current, _, paths in walk(self.config.output_folder))
+        ):
             current_output = PurePath(raw_current_output)
             output_paths = set(map(current_output.joinpath, map(PurePath, raw_output_paths)))
+            # 圧縮したファイルは元のファイルと一緒に消すので、ここでは元のファイルが存在するものを除く。
+            output_paths.difference_update(tuple(
+                path for path in output_paths
+                if path.suffix in ENCODINGS.values() and path.with_suffix("") in output_paths
+            ))
 
             # オリジナルが存在しないものを探す。
             for folder in self.config.FOLDERS:
@@ -251,9 +800,9 @@ class Manager(OSTools, EventTool):
                         # インプットフォルダの場合はインプット元の拡張子が変わるためありえる拡張子を全て試す。
                         for ext in self.config.input_exts:
                             new_path = self.exchange_extension(original_path, ext)
-                            if exists(new_path):
+                            if self.exists(new_path):
                                 found.append(output_path)
-                    elif exists(original_path):
+                    elif self.exists(original_path):
                         found.append(output_path)
                 # 身元が見つかったものはチェック対象から外す。
                 for path in found:
@@ -261,9 +810,6 @@ class Manager(OSTools, EventTool):
 
             # 掃除をする。
             for output_path in output_paths:
-                # キャッシュに存在するものは消す。
-                if original_path in self.caches.outputs:
-                    del self.caches.outputs[original_path]
                 # オリジナルが存在しない出力結果を消す。
                 self._clean(None, output_path, False)
 
@@ -279,15 +825,54 @@ class Manager(OSTools, EventTool):
                     del self.caches.outputs[raw_path]
         elif raw_input_path in self.caches.outputs:
             del self.caches.outputs[raw_input_path]
+        raw_output_path = str(output_path)
+        if is_directory:
+            # フォルダの場合は、その中にあるもののキャッシュを全て探して消す。
+            for section in (self.caches.manifest, self.caches.digests):
+                for raw_path in tuple(section.keys()):
+                    if raw_path.startswith(raw_input_path):
+                        del section[raw_path]
+            for raw_path in tuple(self.caches.dependencies.keys()):
+                if raw_path.startswith(raw_input_path):
+                    self.caches.set_dependencies(raw_path, ())
+            for raw_path in tuple(self.caches.output_digests.keys()):
+                if raw_path.startswith(f"{raw_output_path}/"):
+                    del self.caches.output_digests[raw_path]
+        else:
+            # ファイルの場合は、キャッシュ全体を走査せずにキーで直接消す。
+            self.caches.manifest.pop(raw_input_path, None)
+            self.caches.digests.pop(raw_input_path, None)
+            self.caches.set_dependencies(raw_input_path, ())
+            self.caches.output_digests.pop(raw_output_path, None)
         if is_directory:
             self.rmdir(output_path)
         else:
             self.remove(output_path)
+            for encoding in ENCODINGS:
+                if self.output_exists(sidecar := PurePath(sidecar_path(output_path, encoding))):
+                    self.remove(sidecar)
+        self._report_output(output_path)
         self.console.log("{} {}".format(_green('Cleaned'), output_path))
 
 
+def _get_markdown_backend() -> str:
+    """Markdownの変換に使われるライブラリの名前とバージョンを返します。
+    `.markdown`を読み込むとライブラリも読み込まれて遅いので、読み込まずに調べる。
+    ライブラリの選び方は`.markdown`と同じにすること。"""
+    from importlib.util import find_spec
+    from importlib.metadata import version, PackageNotFoundError
+
+    backend = "mistletoe" if find_spec("mizu") is None else "mizu"
+    try:
+        return f"{backend} {version(backend)}"
+    except PackageNotFoundError:
+        return backend
+
+
 CT = TypeVar("CT")
+_REPLACEABLE: list[str] = []
 def _replace_cls(name: str) -> Callable[[CT], CT]:
+    _REPLACEABLE.append(name)
     def decorator(c: CT) -> CT:
         def __init_subclass__(cls, /, **kwargs):
             setattr(Manager, name, cls)
@@ -296,4 +881,8 @@ def _replace_cls(name: str) -> Callable[[CT], CT]:
         if not hasattr(Manager, name):
             setattr(Manager, name, c)
         return c
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+# `Manager.page_cls`と`Manager.waste_checker_cls`を設定するために読み込む。
+from . import waste_checker, page # noqa: E402
@@ -1,12 +1,16 @@
 # nisshi - Markdown
 
 try: from mizu import parse_ext
-except ModuleNotFoundError: from mistletoe import markdown
+except ModuleNotFoundError:
+    from mistletoe import markdown, __version__ as VERSION
+    BACKEND = "mistletoe"
 else:
     from typing import Any
+    import mizu
+    VERSION, BACKEND = getattr(mizu, "__version__", ""), "mizu"
     def markdown(text: str, *args: Any, **kwargs: Any) -> str:
         kwargs.setdefault("tables", True)
         return parse_ext(text, *args, **kwargs)
 
 
-__all__ = ("markdown",)
+__all__ = ("markdown", "BACKEND", "VERSION")
@@ -0,0 +1,72 @@
+# nisshi - Outputs
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+from dataclasses import dataclass
+
+from pathlib import PurePath
+from os import stat
+
+
+__all__ = ("MemoryFile", "MemoryOutputs")
+
+
+@dataclass
+class MemoryFile:
+    """A file in :class:`MemoryOutputs`.
+    If ``source`` is set, the contents are read from the file of that path instead of ``data`` when needed."""
+
+    data: bytes = b""
+    source: str | None = None
+    mtime: float = 0.0
+
+    def read(self) -> bytes:
+        "Read the contents of the file."
+        if self.source is not None:
+            with open(self.source, "rb") as f:
+                return f.read()
+        return self.data
+
+    @property
+    def size(self) -> int:
+        "The size of the contents of the file."
+        return stat(self.source).st_size if self.source is not None else len(self.data)
+
+
+class MemoryOutputs(dict[str, MemoryFile]):
+    """Virtual output folder which keeps files in memory.
+    The keys are the paths to the output files. (e.g. ``outputs/index.html``)
+    It is used instead of writing files to the output folder when :attr:`.config.Config.in_memory` is enabled."""
+
+    def is_directory(self, path: PurePath | str) -> bool:
+        """Whether the path is a directory which has files.
+
+        Args:
+            path: The path."""
+        prefix = f"{path}/"
+        return any(key.startswith(prefix) for key in self.keys())
+
+    def remove_directory(self, path: PurePath | str) -> None:
+        """Remove the files in the directory.
+
+        Args:
+            path: The path to the directory."""
+        prefix = f"{path}/"
+        for key in tuple(self.keys()):
+            if key.startswith(prefix):
+                del self[key]
+
+    def walk(self, path: PurePath | str) -> Iterator[tuple[str, list[str]]]:
+        """This is like :func:`os.walk`. It yields the path to each directory and the names of the files in it.
+
+        Args:
+            path: The path to the top directory."""
+        directories: dict[str, list[str]] = {}
+        prefix = f"{path}/"
+        for key in sorted(self.keys()):
+            if key.startswith(prefix):
+                parent = PurePath(key)
+                directories.setdefault(str(parent.parent), []).append(parent.name)
+        yield from directories.items()
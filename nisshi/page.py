@@ -3,37 +3,44 @@
 from __future__ import annotations
 
 from typing import Any
+from collections.abc import Iterator
 
+from contextlib import contextmanager
 from pathlib import PurePath
 
 from tempylate import Template
+from tempylate.builtins import include, aioinclude
 
 from .manager import Manager, _replace_cls
-from .common import Context
+from .common import FastContext
+from .config import record_reads, _DEPENDENCY_PREFIX
 
 
 __all__ = ("PageContext", "Page")
 
 
-class PageContext(Context):
-    "A class typed after :class:`Context` for web page metadata."
+class PageContext(FastContext):
+    "A class typed after :class:`.common.FastContext` for web page metadata."
 
     title: str = ""
     description: str = ""
     head: str = ""
 
 
-def _render_hook(self, kwargs):
+def _render_hook(self, args, kwargs):
     kwargs["__self__"].template = self
+    # 読み込まれたテンプレートを依存関係として記録する。
+    if (template_name := args[0] if args else kwargs.get("template_name")) is not None:
+        kwargs["__self__"].add_dependency(template_name)
     kwargs["__self__"].on_read_raw()
 _original_render = Template.render
 def _new_render(self, *args, **kwargs):
-    _render_hook(self, kwargs)
+    _render_hook(self, args, kwargs)
     return _original_render(self, *args, **kwargs)
 Template.render = _new_render # type: ignore
 _original_aiorender = Template.aiorender
 async def _new_aiorender(self, *args, **kwargs):
-    _render_hook(self, kwargs)
+    _render_hook(self, args, kwargs)
     return await _original_aiorender(self, *args, **kwargs)
 Template.aiorender = _new_aiorender # type: ignore
 
@@ -51,7 +58,10 @@ class Page:
     def __init__(self, manager: Manager, input_path: PurePath):
         self.manager, self.input_path = manager, input_path
         self.ctx = self.context_cls()
-        self.manager.dispatch("on_init_page", self)
+        self.dependencies: set[str] = set()
+        if self.manager.listeners.get("on_init_page"):
+            with self.record_config():
+                self.manager.dispatch("on_init_page", self)
 
     def render(self, **kwargs: Any) -> None:
         """Renders the page.
@@ -60,14 +70,33 @@ class Page:
 
         Args:
             **kwargs: Keyword arguments to be passed to page."""
-        self.result = self.manager.tempylate.render_from_file(
-            str(self.input_path), **kwargs
-        )
+        with self.manager.tracer.span("render", "template", path=str(self.input_path)):
+            self.result = self.manager.tempylate.render_from_file(
+                str(self.input_path), **kwargs
+            )
         self.result = self.manager.markdown(self.result)
         self.content = self.result
-        self.result = self.manager.tempylate.render_from_file(
-            str(self.layout), **kwargs
-        )
+        with self.manager.tracer.span("render layout", "template", path=str(self.layout)):
+            self.result = self.manager.tempylate.render_from_file(
+                str(self.layout), **kwargs
+            )
+
+    async def aiorender(self, **kwargs: Any) -> None:
+        """This is an asynchronous version of :meth:`Page.render`.
+        The templates are rendered with :meth:`tempylate.template.Template.aiorender`, so their blocks can use ``await``.
+
+        Args:
+            **kwargs: Keyword arguments to be passed to page."""
+        with self.manager.tracer.span("render", "template", path=str(self.input_path)):
+            self.result = await self.manager.tempylate.aiorender_from_file(
+                str(self.input_path), load_block_run_in_executor=False, **kwargs
+            )
+        self.result = self.manager.markdown(self.result)
+        self.content = self.result
+        with self.manager.tracer.span("render layout", "template", path=str(self.layout)):
+            self.result = await self.manager.tempylate.aiorender_from_file(
+                str(self.layout), load_block_run_in_executor=False, **kwargs
+            )
 
     def build(self, **kwargs: Any) -> str:
         """Execute :meth:`Page.render` to build.
@@ -75,9 +104,27 @@ class Page:
         Args:
             **kwargs: Keyword arguments to be passed to page."""
         kwargs.setdefault("__self__", self)
-        self.manager.dispatch("on_before_build_page", self)
-        self.render(**kwargs)
-        self.manager.dispatch("on_after_build_page", self)
+        kwargs.setdefault("include", self.include)
+        with self.record_config():
+            self.manager.dispatch("on_before_build_page", self)
+            self.render(**kwargs)
+            self.manager.dispatch("on_after_build_page", self)
+        return self.result
+
+    async def aiobuild(self, **kwargs: Any) -> str:
+        """This is an asynchronous version of :meth:`Page.build`.
+        It is used instead of :meth:`Page.build` when :attr:`.config.Config.async_build` is enabled.
+        Event listeners of ``on_before_build_page`` and ``on_after_build_page`` can be coroutine functions.
+
+        Args:
+            **kwargs: Keyword arguments to be passed to page."""
+        kwargs.setdefault("__self__", self)
+        kwargs.setdefault("include", self.include)
+        kwargs.setdefault("aioinclude", self.aioinclude)
+        with self.record_config():
+            await self.manager.aiodispatch("on_before_build_page", self)
+            await self.aiorender(**kwargs)
+            await self.manager.aiodispatch("on_after_build_page", self)
         return self.result
 
     @property
@@ -85,11 +132,49 @@ class Page:
         "Gets the path to the layout file."
         if self._layout is None:
             self._layout = PurePath(self.manager.config.default_layout)
+            # ページのビルド前に使われることがあるので、設定への依存関係はここで記録する。
+            self.dependencies.add(f"{_DEPENDENCY_PREFIX}default_layout")
         return self._layout
 
     @layout.setter
     def layout(self, value: str) -> None:
         self._layout = PurePath(value)
 
+    def add_dependency(self, path: str | PurePath) -> None:
+        """Record the file as a template which this page depends on.
+        When the file is changed, this page will be rebuilt.
+        Templates rendered with this page and files read with ``include`` in templates are recorded automatically.
+
+        Args:
+            path: The path to the file."""
+        if (path := str(PurePath(path))) != str(self.input_path):
+            self.dependencies.add(path)
+
+    @contextmanager
+    def record_config(self) -> Iterator[None]:
+        """Record the settings read in this context as dependencies of this page. (e.g. ``config:metadata``)
+        When one of them is changed, this page will be rebuilt.
+        It is used while the page is built, so settings read in templates and event listeners are recorded automatically."""
+        with record_reads() as reads:
+            yield
+        self.dependencies.update(f"{_DEPENDENCY_PREFIX}{key}" for key in reads)
+
+    def include(self, path: str) -> str:
+        """This is ``include`` of tempylate that records the file as a dependency.
+
+        Args:
+            path: The path to the file."""
+        self.add_dependency(path)
+        return include(path)
+
+    async def aioinclude(self, path: str) -> str:
+        """This is an asynchronous version of :meth:`Page.include`.
+        The file is read in the default executor of the event loop.
+
+        Args:
+            path: The path to the file."""
+        self.add_dependency(path)
+        return await aioinclude(path)
+
     def on_read_raw(self) -> None:
         "Function called when a document to be rendered is loaded."
\ No newline at end of file
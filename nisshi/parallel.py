@@ -0,0 +1,106 @@
+# nisshi - Parallel
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+from collections.abc import Iterator, Sequence
+
+from dataclasses import dataclass
+from itertools import repeat
+
+from pathlib import PurePath
+from pickle import dumps
+
+from .outputs import MemoryFile
+
+if TYPE_CHECKING:
+    from .processor import Processor
+    from .manager import Manager
+
+
+__all__ = ("ProcessResult", "process_in_parallel")
+
+
+@dataclass
+class ProcessResult:
+    "The result of a processor run in a worker process."
+
+    done: bool
+    update: bool | None
+    output_path: PurePath | None
+    error: Exception | None
+    written: bool
+    caches: dict[str, dict[str, Any]]
+    outputs: dict[str, MemoryFile]
+    trace: list[dict[str, Any]]
+
+
+_manager: Manager | None = None
+def _initialize(config: Any, caches: Any, extensions: Sequence[str]) -> None:
+    # ワーカープロセスで使うManagerを用意する。
+    global _manager
+    from .manager import Manager
+    _manager = Manager(config, caches)
+    for name in extensions:
+        if name not in _manager.extensions:
+            _manager.load_extension(name)
+
+
+def _process(
+    processor_cls: type[Processor], path: PurePath, directory: PurePath
+) -> ProcessResult:
+    # ワーカープロセスで処理を実行する。
+    assert _manager is not None
+    processor = processor_cls(_manager, path, directory)
+    done = processor.start()
+
+    error = processor.error
+    if error is not None:
+        # 親プロセスに送れないエラーは文字列にしておく。
+        try:
+            dumps(error)
+        except Exception:
+            error = RuntimeError(repr(error))
+
+    keys = {str(path)}
+    if processor.output_path is not None:
+        keys.add(str(processor.output_path))
+    if (page := getattr(processor, "page", None)) is not None:
+        keys.add(str(page.layout))
+        keys.update(page.dependencies)
+    # メモリ上に出力した場合は、それも親プロセスに送る。
+    outputs = {}
+    if _manager.memory_outputs is not None and processor.output_path is not None \
+            and (raw_output_path := str(processor.output_path)) in _manager.memory_outputs:
+        outputs[raw_output_path] = _manager.memory_outputs.pop(raw_output_path)
+    return ProcessResult(
+        done, getattr(processor, "update", None), processor.output_path,
+        error, processor.written, _manager.caches.extract(keys), outputs, _manager.tracer.take()
+    )
+
+
+def process_in_parallel(
+    manager: Manager, processor_cls: type[Processor],
+    tasks: Sequence[tuple[PurePath, PurePath]], workers: int
+) -> Iterator[tuple[tuple[PurePath, PurePath], ProcessResult]]:
+    """Run processors in worker processes.
+    Each worker process builds its own :class:`Manager` and loads the same extensions as the passed manager.
+    The results are yielded in the order of ``tasks``.
+
+    Args:
+        manager: The manager whose configuration and caches are used by workers.
+        processor_cls: The class of the processor.
+        tasks: Pairs of the input path and the output directory.
+        workers: The number of worker processes."""
+    if not tasks:
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(
+        workers, initializer=_initialize, initargs=(
+            manager.config, manager.caches, tuple(manager.extensions)
+        )
+    ) as executor:
+        yield from zip(tasks, executor.map(
+            _process, repeat(processor_cls), *zip(*tasks),
+            chunksize=max(1, len(tasks) // (workers * 4))
+        ))
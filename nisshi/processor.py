@@ -7,10 +7,10 @@ from typing import TYPE_CHECKING, Any
 from dataclasses import dataclass
 
 from pathlib import PurePath
-from os.path import exists
-from shutil import copy
 
 from .common import _color, _green, _update_text
+from .caches import OutputMetadata
+from .config import _DEPENDENCY_PREFIX
 
 if TYPE_CHECKING:
     from .manager import Manager
@@ -32,7 +32,10 @@ class Processor:
     result: Any | None = None
     output_path: PurePath | None = None
     error: Exception | None = None
+    written: bool = True
+    "Whether the output file was written. This is ``False`` if the contents were the same and the writing was skipped."
     _target_directory_key: str = ""
+    _parallel: bool = False
 
     @property
     def target_directory(self) -> str:
@@ -43,29 +46,70 @@ class Processor:
         "処理をしていいかどうかのチェックをする。"
         return True
 
+    def make_output_path(self) -> PurePath | None:
+        "出力先のパスを作ります。出力しない場合は`None`を返します。"
+        return None
+
     def on_run(self) -> Any:
         "処理の実行が決まった際に呼ばれる関数です。"
 
     def process(self) -> Any:
         "処理するプログラムを実行する関数です。"
 
+    async def aioprocess(self) -> Any:
+        "`process`の非同期版です。デフォルトでは`process`を実行します。"
+        return self.process()
+
     def start(self) -> bool:
         "処理を実行します。`check`等を実行します。処理をする場合はこれを呼び出してください。"
-        if self.check():
+        with self.manager.tracer.span(str(self.input_path), "file"):
+            return self._start()
+
+    def _start(self) -> bool:
+        with self.manager.tracer.span("check", "check"):
+            checked = self.check()
+        if checked:
             try:
-                self.result = self.process()
+                with self.manager.tracer.span("process", "process"):
+                    self.result = self.process()
             except Exception as e:
-                self.manager._print_exception()
-                self.error = e
-                self.on_error(e)
-                # もし出力先のファイルが存在するなら消す。
-                if self.output_path is not None and exists(self.output_path):
-                    self.manager.remove(self.output_path)
+                self._fail(e)
             else:
-                self.on_success()
+                self._succeed()
                 return True
         return False
 
+    async def aiostart(self) -> bool:
+        "`start`の非同期版です。`process`の代わりに`aioprocess`を実行します。"
+        with self.manager.tracer.span(str(self.input_path), "file"):
+            with self.manager.tracer.span("check", "check"):
+                checked = self.check()
+            if checked:
+                try:
+                    with self.manager.tracer.span("process", "process"):
+                        self.result = await self.aioprocess()
+                except Exception as e:
+                    self._fail(e)
+                else:
+                    self._succeed()
+                    return True
+            return False
+
+    def _fail(self, e: Exception) -> None:
+        # 失敗した時の処理をする。
+        self.manager._print_exception()
+        self.error = e
+        self.on_error(e)
+        # もし出力先のファイルが存在するなら消す。
+        if self.output_path is not None and self.manager.output_exists(self.output_path):
+            self.manager.remove(self.output_path)
+
+    def _succeed(self) -> None:
+        # 成功した時の処理をする。
+        self.on_success()
+        if self.written:
+            self.manager._report_output(self.output_path)
+
     def on_error(self, _: Exception) -> Any:
         "エラー時に呼び出される関数です。"
         self.manager.console.log(_color("bold", "red", "Failed to process"), self.input_path)
@@ -89,6 +133,7 @@ class RenderProcessor(CacheProcessor):
     "ビルドのレンダリングの過程をするProcessorです。"
 
     _target_directory_key = "input"
+    _parallel = True
 
     def check(self) -> bool:
         if any(
@@ -97,31 +142,79 @@ class RenderProcessor(CacheProcessor):
         ) and super().check():
             self.page = self.manager.page_cls(self.manager, self.input_path)
 
-            # レイアウトが変更されている場合は、レイアウトが変わったことがわかるようにしておく。
-            if self.manager.waste_checker.judge(self.page.layout, None) is not None:
-                self.manager._updated_layouts.add(self.page.layout)
+            # レイアウト等の依存しているテンプレートが変更されている場合は、それがわかるようにしておく。
+            raw_dependencies = self.manager.caches.dependencies.get(
+                str(self.input_path), (str(self.page.layout),)
+            )
+            # 設定への依存関係は、前回のビルドから設定が変わったかで判断する。
+            force = bool(changed := self.manager.changed_fingerprint) and (
+                self.manager._is_all_pages_outdated() or not changed.isdisjoint(raw_dependencies)
+            )
+            dependencies = tuple(
+                PurePath(raw_dependency) for raw_dependency in raw_dependencies
+                if not raw_dependency.startswith(_DEPENDENCY_PREFIX)
+            )
+            for dependency in dependencies:
+                if not self.manager.exists(dependency) or self.manager.waste_checker.judge(
+                    dependency, None
+                ) is not None:
+                    self.manager._updated_layouts.add(dependency)
+            self._checked_dependencies = set(raw_dependencies)
 
             # 出力先を用意する。
-            self.output_path = self.manager.swap_path(
-                self.input_path, extension=self.manager.config.output_ext
-            )
+            self.output_path = self.make_output_path()
             self.manager.mkdir_if_not_exists(self.output_directory)
-            self._cache(force=self.page.layout in self.manager._updated_layouts)
+            self.manager._record_output(self.input_path, self.output_path)
+            self._cache(force=force or any(
+                dependency in self.manager._updated_layouts
+                for dependency in dependencies
+            ))
             self.page.output_path = self.output_path
 
             return self.update is not None
         return False
 
+    def make_output_path(self) -> PurePath:
+        return self.manager.swap_path(self.input_path, extension=self.manager.config.output_ext)
+
     def process(self) -> Any:
         # ビルドする。
         self.page.build()
-
+        self._record_dependencies()
         assert self.output_path is not None and self.update is not None
-        with open(self.output_path, "w") as f:
-            f.write(self.page.result)
+        with self.manager.tracer.span("write", "write"):
+            self.written = self.manager.write_output(self.output_path, self.page.result)
+        self._record_unchanged()
+
+    async def aioprocess(self) -> Any:
+        # 非同期でビルドする。
+        await self.page.aiobuild()
+        self._record_dependencies()
+        assert self.output_path is not None and self.update is not None
+        with self.manager.tracer.span("write", "write"):
+            self.written = await self.manager.aiowrite_output(self.output_path, self.page.result)
+        self._record_unchanged()
+
+    def _record_dependencies(self) -> None:
+        # 依存関係を記録する。
+        self.manager.caches.set_dependencies(str(self.input_path), self.page.dependencies)
+        # 初めて使われたテンプレートは、次回のビルドで変更されたと判断されないように記録しておく。
+        for dependency in self.page.dependencies.difference(self._checked_dependencies):
+            if self.manager.exists(dependency):
+                self.manager.waste_checker.judge(PurePath(dependency), None)
+
+    def _record_unchanged(self) -> None:
+        if not self.written:
+            # 出力先の更新日時が変わらないので、次回のビルドで変更されたと判断されないように入力元の更新日時を記録しておく。
+            self.manager.caches.outputs[str(self.input_path)] = OutputMetadata(
+                last_update=self.manager.stat(self.input_path).st_mtime, output_path=str(self.output_path)
+            )
 
     def on_success(self):
-        self.manager.console.log(_green(_update_text(self.update)), self.output_path)
+        self.manager.console.log(
+            _green(_update_text(self.update)) if self.written else "Unchanged",
+            self.output_path
+        )
 
 
 class IncludeProcessor(CacheProcessor):
@@ -131,16 +224,21 @@ class IncludeProcessor(CacheProcessor):
 
     def check(self) -> bool:
         if super().check():
-            self.output_path = self.manager.swap_path(self.input_path)
+            self.output_path = self.make_output_path()
             self.manager.mkdir_if_not_exists(self.output_directory)
+            self.manager._record_output(self.input_path, self.output_path)
             self._cache()
             return self.update is not None
         return False
 
+    def make_output_path(self) -> PurePath:
+        return self.manager.swap_path(self.input_path)
+
     def process(self) -> Any:
         # コピーする。
         assert self.output_path is not None
-        copy(self.input_path, self.output_path)
+        with self.manager.tracer.span("copy", "copy"):
+            self.manager.copy_output(self.input_path, self.output_path)
 
     def on_success(self):
         self.manager.console.log(
@@ -0,0 +1,248 @@
+# nisshi - Server
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import asyncio
+
+from mimetypes import guess_type
+from urllib.parse import unquote, urlsplit
+
+from pathlib import PurePath
+from os.path import isdir, isfile, normpath, join, getsize
+
+from .json import dumps
+from .compression import ENCODINGS, sidecar_path, is_fresh
+
+if TYPE_CHECKING:
+    from .manager import Manager
+
+
+__all__ = ("DevServer",)
+
+
+EVENTS_PATH = "/__nisshi__/events"
+RELOAD_SCRIPT = """<script>
+new EventSource("%s").onmessage = (event) => {
+  const paths = JSON.parse(event.data);
+  if (paths.includes(location.pathname) || paths.includes("*")) location.reload();
+};
+</script>""" % EVENTS_PATH
+SENDFILE_THRESHOLD = 1 << 16
+STATUSES = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed"
+}
+
+
+class DevServer:
+    """HTTP server for development made with :mod:`asyncio`.
+    It serves the output folder (or :attr:`.manager.Manager.memory_outputs`) concurrently and tells browsers to reload pages rebuilt by hot reload with Server-Sent Events.
+    Large files are sent with ``loop.sendfile``.
+    The precompressed files made by :attr:`.config.Config.compress` are served if browsers accept their encoding.
+    Pages are not served in them because the script for reloading is embedded into pages.
+
+    Args:
+        manager: The manager whose output folder is served.
+        host: The host.
+        port: The port."""
+
+    def __init__(self, manager: Manager, host: str, port: int):
+        self.manager, self.host, self.port = manager, host, port
+        self.loop = asyncio.new_event_loop()
+        self.clients: set[asyncio.Queue[str]] = set()
+        self.manager.add_listener(self.on_after_build_batch)
+
+    def to_urls(self, output_path: PurePath) -> list[str]:
+        """Get the URLs to the output file.
+
+        Args:
+            output_path: The path to the output file."""
+        url = "/" + "/".join(self.manager.remove_local_folder_path(output_path).parts)
+        urls = [url]
+        if output_path.suffix == f".{self.manager.config.output_ext}":
+            urls.append(url[:-len(output_path.suffix)])
+            if output_path.stem == "index":
+                urls.append(url[:-len(output_path.name)])
+        return urls
+
+    def on_after_build_batch(self, outputs: list[PurePath]) -> None:
+        "Tell browsers that pages have been rebuilt. This is called from the thread of hot reload."
+        urls: list[str] = []
+        for output_path in outputs:
+            if output_path.suffix == f".{self.manager.config.output_ext}":
+                urls.extend(self.to_urls(output_path))
+            else:
+                # CSS等が変わった場合は全てのページを再読み込みさせる。
+                urls.append("*")
+        if urls:
+            self.loop.call_soon_threadsafe(self._broadcast, dumps(urls))
+
+    def _broadcast(self, data: str) -> None:
+        for client in self.clients:
+            client.put_nowait(data)
+
+    def serve_forever(self) -> None:
+        "Start the server. This blocks until the server is stopped."
+        self.loop.run_until_complete(self._serve())
+
+    async def _serve(self) -> None:
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    def _is_file(self, path: str) -> bool:
+        if self.manager.memory_outputs is not None:
+            return path in self.manager.memory_outputs
+        return isfile(path)
+
+    def _is_directory(self, path: str) -> bool:
+        if self.manager.memory_outputs is not None:
+            return self.manager.memory_outputs.is_directory(path)
+        return isdir(path)
+
+    def _resolve(self, url: str) -> str | None:
+        # URLから出力先のファイルのパスを作る。
+        root = self.manager.config.output_folder
+        path = normpath(join(root, unquote(url).lstrip("/")))
+        if path != root and not path.startswith(root + "/"):
+            return None
+        if self._is_directory(path):
+            path = join(path, f"index.{self.manager.config.output_ext}")
+        elif not self._is_file(path):
+            path = f"{path}.{self.manager.config.output_ext}"
+        return path if self._is_file(path) else None
+
+    def _read(self, path: str) -> bytes:
+        if self.manager.memory_outputs is not None:
+            return self.manager.memory_outputs[path].read()
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _encoding(self, path: str, accept_encoding: str) -> str | None:
+        # ブラウザが受け入れられて、最新の圧縮されたファイルがあるエンコーディングを探す。
+        if self.manager.memory_outputs is not None:
+            return None
+        accepted = set()
+        for value in accept_encoding.split(","):
+            name, _, parameter = value.strip().partition(";")
+            if parameter.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(name.strip().lower())
+        for encoding in ENCODINGS:
+            if (encoding in accepted or "*" in accepted) and is_fresh(path, encoding):
+                return encoding
+        return None
+
+    def _source(self, path: str) -> tuple[str | None, int]:
+        # 実際のファイルのパスとその大きさを取得する。メモリ上のデータの場合はパスが`None`になる。
+        if self.manager.memory_outputs is not None:
+            file = self.manager.memory_outputs[path]
+            return file.source, file.size
+        return path, getsize(path)
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, status: int,
+        headers: dict[str, str | None], body: bytes = b""
+    ) -> None:
+        # 値が`None`のヘッダーは送らない。
+        headers.setdefault("Content-Length", str(len(body)))
+        headers.setdefault("Connection", "close")
+        writer.write("HTTP/1.1 {} {}\r\n{}\r\n".format(
+            status, STATUSES[status], "".join(
+                f"{key}: {value}\r\n" for key, value in headers.items()
+                if value is not None
+            )
+        ).encode() + body)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            headers: dict[str, str] = {}
+            while (line := (await reader.readline()).decode("latin-1").strip()):
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            try:
+                method, target, _ = request_line.split(" ", 2)
+            except ValueError:
+                return await self._respond(writer, 400, {})
+            status = await self._handle_request(writer, method, urlsplit(target).path, headers)
+            self.manager.console.log(
+                "Serve", writer.get_extra_info("peername", ("", 0))[0],
+                f'"{request_line}" {status}'
+            )
+        except (ConnectionError, asyncio.IncompleteReadError):
+            ...
+        finally:
+            writer.close()
+
+    async def _handle_request(
+        self, writer: asyncio.StreamWriter, method: str,
+        url: str, headers: dict[str, str]
+    ) -> int:
+        if method not in ("GET", "HEAD"):
+            await self._respond(writer, 405, {"Allow": "GET, HEAD"})
+            return 405
+
+        if url == EVENTS_PATH:
+            await self._stream_events(writer)
+            return 200
+
+        if (path := self._resolve(url)) is None:
+            await self._respond(writer, 404, {"Content-Type": "text/plain"}, b"Not Found")
+            return 404
+        content_type = guess_type(path)[0] or "application/octet-stream"
+        response_headers: dict[str, str | None] = {
+            "Content-Type": content_type, "Cache-Control": "no-cache"
+        }
+
+        if content_type == "text/html":
+            # ライブリロードのためのスクリプトを埋め込む。
+            body = self._read(path)
+            index = body.rfind(b"</body>")
+            body = body[:index] + RELOAD_SCRIPT.encode() + body[index:] \
+                if index != -1 else body + RELOAD_SCRIPT.encode()
+            response_headers["Content-Length"] = str(len(body))
+            await self._respond(writer, 200, response_headers, b"" if method == "HEAD" else body)
+        elif (encoding := self._encoding(path, headers.get("accept-encoding", ""))) is not None:
+            path = sidecar_path(path, encoding)
+            response_headers["Content-Encoding"] = encoding
+            response_headers["Vary"] = "Accept-Encoding"
+            response_headers["Content-Length"] = str(getsize(path))
+            await self._respond(writer, 200, response_headers)
+            if method == "GET":
+                with open(path, "rb") as f:
+                    await self.loop.sendfile(writer.transport, f)
+        elif ((source := self._source(path))[0] is not None
+                and source[1] >= SENDFILE_THRESHOLD and method == "GET"):
+            # 大きいファイルは`sendfile`で送る。
+            response_headers["Content-Length"] = str(source[1])
+            await self._respond(writer, 200, response_headers)
+            with open(source[0], "rb") as f:
+                await self.loop.sendfile(writer.transport, f)
+        else:
+            body = self._read(path) if method == "GET" else b""
+            response_headers["Content-Length"] = str(source[1])
+            await self._respond(writer, 200, response_headers, body)
+        return 200
+
+    async def _stream_events(self, writer: asyncio.StreamWriter) -> None:
+        await self._respond(writer, 200, {
+            "Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+            "Content-Length": None, "Connection": "keep-alive"
+        })
+        self.clients.add(queue := asyncio.Queue[str]())
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    # 接続が切れたかどうかを確かめるためにコメントを送る。
+                    writer.write(b": ping\n\n")
+                else:
+                    writer.write(f"data: {data}\n\n".encode())
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
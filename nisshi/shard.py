@@ -0,0 +1,61 @@
+# nisshi - Shard
+
+from __future__ import annotations
+
+from pathlib import PurePath
+from hashlib import blake2b
+from os.path import splitext
+from glob import glob
+
+
+__all__ = ("parse_shard", "shard_of", "shard_caches_file", "find_shard_caches_files")
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """Parse the text of a shard such as ``2/4``.
+
+    Args:
+        text: The text. It is the number of the shard (from 1) and the number of shards separated by ``/``.
+
+    Raises:
+        ValueError: The text is invalid."""
+    index, _, count = text.partition("/")
+    try:
+        result = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"The shard must be like `1/4`: {text!r}") from None
+    if not 1 <= result[0] <= result[1]:
+        raise ValueError(f"The number of the shard must be from 1 to {result[1]}: {text!r}")
+    return result
+
+
+def shard_of(path: PurePath | str, count: int) -> int:
+    """Get the number of the shard (from 1) which builds the file.
+    It is decided by a hash of the path, so it is the same on every machine.
+
+    Args:
+        path: The relative path to the file. (e.g. ``inputs/index.md``)
+        count: The number of shards."""
+    raw = PurePath(path).as_posix().encode()
+    return int.from_bytes(blake2b(raw, digest_size=8).digest(), "big") % count + 1
+
+
+def shard_caches_file(caches_file: str, index: int, count: int) -> str:
+    """Get the path to the cache file of the shard. (e.g. ``.nisshi_caches.shard-1-of-4.json``)
+
+    Args:
+        caches_file: The path to the cache file. (:attr:`.config.Config.caches_file`)
+        index: The number of the shard.
+        count: The number of shards."""
+    stem, ext = splitext(caches_file)
+    return f"{stem}.shard-{index}-of-{count}{ext}"
+
+
+def find_shard_caches_files(caches_file: str, ext: str | None = None) -> list[str]:
+    """Find the cache files of shards.
+
+    Args:
+        caches_file: The path to the cache file. (:attr:`.config.Config.caches_file`)
+        ext: The extension of the files. If this is ``None``, the extension of ``caches_file`` is used."""
+    stem, original_ext = splitext(caches_file)
+    return sorted(glob(f"{stem}.shard-*-of-*{original_ext if ext is None else ext}"))
@@ -0,0 +1,166 @@
+# nisshi - Snapshot
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+
+from pathlib import PurePath
+from os import DirEntry, scandir, stat, stat_result, sep
+from os.path import join
+
+
+__all__ = ("Snapshot",)
+
+
+class Snapshot:
+    """The snapshot of the files in folders.
+    It is made with :func:`os.scandir` once when :meth:`Manager.build_all` starts, and the existence and the stat results of the files in the folders are read from it instead of asking the OS each time.
+    The stat result of each file is got from :class:`os.DirEntry` when it is needed for the first time and then reused.
+    Paths outside of the scanned folders are asked to the OS as usual.
+    Files changed by nisshi while building are reflected with :meth:`.update` and :meth:`.discard`.
+
+    Args:
+        directories: The paths to the folders to be scanned."""
+
+    def __init__(self, directories: Iterable[PurePath | str]):
+        self.files: dict[str, DirEntry[str] | stat_result] = {}
+        "The entries or the stat results of the files. The keys are the paths to the files."
+        self.directories: dict[str, tuple[list[str], list[str]]] = {}
+        "The names of the folders and the files in each folder. The keys are the paths to the folders."
+        self.roots = tuple(str(PurePath(directory)) for directory in directories)
+        for root in self.roots:
+            self._scan(root)
+
+    def _scan(self, path: str) -> None:
+        # フォルダの中身を再帰的に記録する。
+        try:
+            iterator = scandir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        directories: list[str] = []
+        files: list[str] = []
+        self.directories[path] = (directories, files)
+        with iterator:
+            for entry in iterator:
+                if entry.is_dir():
+                    directories.append(entry.name)
+                    # `os.walk`と同じように、シンボリックリンクのフォルダの中身は辿らない。
+                    if not entry.is_symlink():
+                        self._scan(join(path, entry.name))
+                else:
+                    files.append(entry.name)
+                    self.files[join(path, entry.name)] = entry
+
+    def covers(self, path: PurePath | str) -> bool:
+        """Whether the path is in the scanned folders.
+
+        Args:
+            path: The path."""
+        raw_path = str(path)
+        return any(
+            raw_path == root or raw_path.startswith(f"{root}{sep}")
+            for root in self.roots
+        )
+
+    def stat(self, path: PurePath | str) -> stat_result:
+        """This is :func:`os.stat` which uses the snapshot.
+
+        Args:
+            path: The path to the file.
+
+        Raises:
+            FileNotFoundError: The file does not exist."""
+        if (result := self.files.get(raw_path := str(path))) is not None:
+            # `DirEntry.stat`は結果をキャッシュするので、二回目以降はシステムコールをしない。
+            return result if type(result) is stat_result else result.stat() # type: ignore
+        if self.covers(raw_path):
+            raise FileNotFoundError(f"No such file: {raw_path!r}")
+        return stat(raw_path)
+
+    def exists(self, path: PurePath | str) -> bool:
+        """This is :func:`os.path.exists` which uses the snapshot.
+
+        Args:
+            path: The path."""
+        if (raw_path := str(path)) in self.files or raw_path in self.directories:
+            return True
+        if self.covers(raw_path):
+            return False
+        try:
+            stat(raw_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        return True
+
+    def is_dir(self, path: PurePath | str) -> bool:
+        """Whether the path is a folder which exists.
+
+        Args:
+            path: The path."""
+        return str(path) in self.directories
+
+    def walk(self, path: PurePath | str) -> Iterator[tuple[str, list[str]]]:
+        """This is like :func:`os.walk`. It yields the path to each folder and the names of the files in it.
+
+        Args:
+            path: The path to the top folder."""
+        if (entry := self.directories.get(raw_path := str(path))) is None:
+            return
+        directories, files = entry
+        yield raw_path, files
+        for name in tuple(directories):
+            yield from self.walk(join(raw_path, name))
+
+    def add_directory(self, path: PurePath | str) -> None:
+        """Record the folder which was made.
+
+        Args:
+            path: The path to the folder."""
+        if (raw_path := str(path)) in self.directories:
+            return
+        self.directories[raw_path] = ([], [])
+        parent = str(PurePath(raw_path).parent)
+        if (entry := self.directories.get(parent)) is not None:
+            entry[0].append(PurePath(raw_path).name)
+
+    def update(self, path: PurePath | str, result: stat_result | None = None) -> None:
+        """Record the file which was written.
+
+        Args:
+            path: The path to the file.
+            result: The stat result of the file. If this is ``None``, :func:`os.stat` is used."""
+        raw_path = str(path)
+        result = stat(raw_path) if result is None else result
+        if raw_path not in self.files:
+            if (entry := self.directories.get(str(PurePath(raw_path).parent))) is not None:
+                entry[1].append(PurePath(raw_path).name)
+        self.files[raw_path] = result
+
+    def refresh(self, path: PurePath | str) -> None:
+        """Ask the OS about the file again. This is used for files changed by other processes.
+
+        Args:
+            path: The path to the file."""
+        try:
+            self.update(path)
+        except FileNotFoundError:
+            self.discard(path)
+
+    def discard(self, path: PurePath | str) -> None:
+        """Forget the file or the folder which was removed.
+
+        Args:
+            path: The path."""
+        raw_path = str(path)
+        name = PurePath(raw_path).name
+        entry = self.directories.get(str(PurePath(raw_path).parent))
+        if self.files.pop(raw_path, None) is not None:
+            if entry is not None and name in entry[1]:
+                entry[1].remove(name)
+        elif (removed := self.directories.pop(raw_path, None)) is not None:
+            if entry is not None and name in entry[0]:
+                entry[0].remove(name)
+            for directory in removed[0]:
+                self.discard(join(raw_path, directory))
+            for file in removed[1]:
+                self.files.pop(join(raw_path, file), None)
@@ -0,0 +1,109 @@
+# nisshi - Sync
+
+from __future__ import annotations
+
+from pathlib import PurePath
+from os import stat, link, remove, replace, getpid
+from os.path import samefile
+from shutil import copyfile, copystat
+
+try:
+    from fcntl import ioctl
+except ImportError:
+    ioctl = None # type: ignore
+
+try:
+    from os import copy_file_range
+except ImportError:
+    copy_file_range = None # type: ignore
+
+try:
+    from os import sendfile
+except ImportError:
+    sendfile = None # type: ignore
+
+
+__all__ = ("STRATEGIES", "sync_file")
+
+
+STRATEGIES = ("copy", "hardlink", "reflink", "copy_file_range")
+"The names of the ways to sync files. See :attr:`.config.Config.include_sync`."
+FICLONE = 0x40049409
+
+
+def _reflink(source: str, destination: str) -> None:
+    # ファイルシステムが対応している場合は、中身を共有したファイルを作る。
+    if ioctl is None:
+        raise OSError("Reflink is not supported on this platform.")
+    with open(source, "rb") as s, open(destination, "wb") as d:
+        ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _copy_file_range(source: str, destination: str) -> None:
+    # カーネル内でコピーする。
+    with open(source, "rb") as s, open(destination, "wb") as d:
+        size = stat(s.fileno()).st_size
+        while size > 0:
+            if copy_file_range is not None:
+                copied = copy_file_range(s.fileno(), d.fileno(), size)
+            elif sendfile is not None:
+                copied = sendfile(d.fileno(), s.fileno(), None, size)
+            else:
+                raise OSError("copy_file_range and sendfile are not supported on this platform.")
+            if copied == 0:
+                break
+            size -= copied
+
+
+def sync_file(source: PurePath | str, destination: PurePath | str, strategy: str = "copy") -> bool:
+    """Make the destination file the same as the source file.
+    If the size and the last modified date of both files are the same, nothing is done.
+    The metadata such as the last modified date is preserved.
+    If the strategy is not available (e.g. the file system does not support it), the file is copied normally.
+
+    Args:
+        source: The path to the source file.
+        destination: The path to the destination file.
+        strategy: The way to sync. It is one of :data:`STRATEGIES`.
+
+    Returns:
+        Whether the file was synced."""
+    source, destination = str(source), str(destination)
+    source_stat = stat(source)
+    try:
+        destination_stat = stat(destination)
+    except FileNotFoundError:
+        ...
+    else:
+        if destination_stat.st_size == source_stat.st_size \
+                and destination_stat.st_mtime_ns == source_stat.st_mtime_ns:
+            return False
+        if strategy == "hardlink" and samefile(source, destination):
+            return False
+
+    # 書き込み途中のファイルが使われないように、一時ファイルに書き込んでから置き換える。
+    # また、ハードリンクされたファイルの中身を書き換えないようにもなる。
+    temporary = f"{destination}.{getpid()}.tmp"
+    try:
+        try:
+            match strategy:
+                case "hardlink":
+                    link(source, temporary)
+                case "reflink":
+                    _reflink(source, temporary)
+                case "copy_file_range":
+                    _copy_file_range(source, temporary)
+                case _:
+                    copyfile(source, temporary)
+        except OSError:
+            copyfile(source, temporary)
+        if strategy != "hardlink":
+            copystat(source, temporary)
+        replace(temporary, destination)
+    except BaseException:
+        try:
+            remove(temporary)
+        except FileNotFoundError:
+            ...
+        raise
+    return True
@@ -0,0 +1,120 @@
+# nisshi - Template
+
+from __future__ import annotations
+
+from typing import Any, TypeAlias
+from collections.abc import Iterable
+
+from importlib.util import MAGIC_NUMBER
+from types import CodeType, FunctionType
+
+from tempylate import Manager as TempylateManager, Template, __version__ as tempylate_version
+from tempylate.exceptions import LoadBlockError
+
+from .caches import LRUCache
+from .hashing import digest
+
+
+__all__ = ("CompiledTemplate", "compile_template", "CachedTemplate", "TemplateManager")
+
+
+CompiledTemplate: TypeAlias = tuple[str | tuple[str, CodeType], ...]
+"The texts of the template and the names and code objects of the blocks of the template."
+
+
+def compile_template(
+    raw: str, args: Iterable[str] = (), template_name: str | None = None,
+    async_mode: bool = False
+) -> CompiledTemplate:
+    """Compile the blocks of the template.
+    This runs :meth:`tempylate.template.Template.prepare` and takes the code objects of the functions made by it, so the result can be cached.
+
+    Args:
+        raw: The template string.
+        args: The names of variables that can be used in the blocks.
+        template_name: The name to be displayed in case of an error.
+        async_mode: Whether the functions of the blocks should be coroutine functions."""
+    template = Template(raw)
+    Template.prepare(template, args, template_name, async_mode)
+    return _extract_compiled(template)
+
+
+def _extract_compiled(template: Template) -> CompiledTemplate:
+    # 準備済みのテンプレートから、文字列とブロックの関数のコードを取り出す。
+    # tempylateの`Template.prepare`は名前を設定した関数を`_objects`に入れるので、それを使う。
+    return tuple(
+        obj if isinstance(obj, str) else (obj.__name__, obj.__code__)
+        for obj in template._objects
+    )
+
+
+class CachedTemplate(Template):
+    """This is :class:`tempylate.template.Template` which reuses compiled blocks.
+    The compiled blocks are cached in :attr:`TemplateManager.compiled` by the name and the content of the template and the version of tempylate."""
+
+    manager: TemplateManager | None
+
+    def prepare(
+        self, args: Iterable[str] = (), template_name: str | None = None,
+        async_mode: bool = False
+    ) -> None:
+        if self.manager is None:
+            return super().prepare(args, template_name, async_mode)
+        if self.prepared:
+            raise LoadBlockError("The block has already been loaded.")
+
+        # コンパイル済みのものがあればそれを使う。
+        # tempylateが変わるとコンパイルの仕方も変わりうるので、バージョンもキーに含める。
+        args = tuple(args)
+        key = digest("\0".join((
+            MAGIC_NUMBER.hex(), tempylate_version, str(template_name),
+            str(async_mode), ",".join(args), self.raw
+        )))
+        if (compiled := self.manager.compiled.get(key)) is None:
+            super().prepare(args, template_name, async_mode)
+            self.manager.compiled.set(key, _extract_compiled(self))
+            return
+        self.prepared = True
+
+        # 関数を生成する。
+        for obj in compiled:
+            if isinstance(obj, str):
+                self._objects.append(obj)
+            else:
+                name, code = obj
+                self.blocks[name] = FunctionType(code, {})
+                self.blocks[name].__name__ = name
+                self._objects.append(self.blocks[name])
+
+
+class TemplateManager(TempylateManager[CachedTemplate]):
+    """This is :class:`tempylate.manager.Manager` which uses :class:`CachedTemplate` by default.
+    Templates rendered with :meth:`.aiorender` are kept apart from templates rendered with :meth:`.render` because their blocks are coroutine functions.
+
+    Args:
+        *args: Arguments passed to :class:`tempylate.manager.Manager`.
+        compiled: The cache of compiled templates.
+        **kwargs: Keyword arguments passed to :class:`tempylate.manager.Manager`."""
+
+    def __init__(
+        self, *args: Any, compiled: LRUCache[CompiledTemplate] | None = None,
+        **kwargs: Any
+    ):
+        kwargs.setdefault("cls", CachedTemplate)
+        super().__init__(*args, **kwargs)
+        self.compiled = compiled or LRUCache[CompiledTemplate]()
+        self.async_caches: dict[str, Template] = {}
+
+    def _prepare_template(self, raw, template_name, kwargs):
+        # 同期と非同期の片方でファイルが読み込み直された場合でも作り直すように、内容も比べる。
+        if (template := self.caches.get(template_name)) is not None and template.raw != raw:
+            kwargs["__tempylate_cached"] = True
+        return super()._prepare_template(raw, template_name, kwargs)
+
+    async def aiorender(self, raw: str, template_name: str, *args: Any, **kwargs: Any) -> str:
+        self.caches, self.async_caches = self.async_caches, self.caches
+        try:
+            template = self._prepare_template(raw, template_name, kwargs)
+        finally:
+            self.caches, self.async_caches = self.async_caches, self.caches
+        return await template.aiorender(template_name, *args, **kwargs)
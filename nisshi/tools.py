@@ -3,22 +3,38 @@
 from __future__ import annotations
 
 from typing import TYPE_CHECKING, TypeVar, Any
-from collections.abc import Iterator, Callable, Sequence
+from collections.abc import Iterator, Iterable, Callable, Sequence
+from types import CodeType, FunctionType, MethodType, ModuleType
 
 from collections import defaultdict
 
 from pathlib import PurePath
-from os import listdir, rmdir, walk, mkdir, remove
+from os import listdir, rmdir, walk, mkdir, remove, replace, stat, stat_result, getpid
 from os.path import exists
 from shutil import rmtree
+from time import time
+from inspect import isawaitable
+import re
 
 from .common import Context
+from .caches import FileDigest
+from .hashing import digest
+from .outputs import MemoryFile
+from .sync import sync_file
+from .shard import shard_of
 
 if TYPE_CHECKING:
     from .manager import Manager
 
 
-__all__ = ("OSTools", "enum", "Group", "EventTools")
+__all__ = ("OSTools", "enum", "Group", "EventTools", "PAGE_EVENTS", "fingerprint")
+
+
+PAGE_EVENTS = (
+    "on_init_page", "on_before_build_page", "on_after_build_page",
+    "on_before_build_directory", "on_after_build_directory", "on_build"
+)
+"The names of the events whose listeners can change the output of pages."
 
 
 class OSTools:
@@ -58,9 +74,30 @@ class OSTools:
 
     def walk_for_build(self, target_directory: str) -> Iterator[tuple[PurePath, PurePath]]:
         """This is :func:`os.walk` for build.
-        Returns the path to a file in the specified input directory and the path to the output directory when a file of that path is built."""
-        if exists(target_directory):
-            for current_, _, raw_paths in walk(target_directory):
+        Returns the path to a file in the specified input directory and the path to the output directory when a file of that path is built.
+        If :attr:`.config.Config.shard_count` is greater than 1, only the files of the shard are returned."""
+        for current, current_output, paths in self._walk_directories(target_directory):
+            self.manager.dispatch("on_before_build_directory", current, current_output)
+            for path in paths:
+                yield path, current_output
+            self.manager.dispatch("on_after_build_directory", current, current_output)
+
+    def _walk_directories(
+        self, target_directory: str
+    ) -> Iterator[tuple[PurePath, PurePath, list[PurePath]]]:
+        """フォルダごとに、そのパスと出力先のフォルダのパスとビルドするファイルのパスを返します。
+        `walk_for_build`と違い、`on_before_build_directory`等のイベントは呼びません。"""
+        shard_count = self.manager.config.shard_count
+        if self.exists(target_directory):
+            iterator = self.manager.snapshot.walk(target_directory) \
+                if self.manager.snapshot is not None \
+                else ((current, paths) for current, _, paths in walk(target_directory))
+            while True:
+                with self.manager.tracer.span("walk", "walk", directory=target_directory):
+                    try:
+                        current_, raw_paths = next(iterator)
+                    except StopIteration:
+                        break
                 current_output = PurePath(self.manager.config.output_folder)
                 try:
                     (current := PurePath(current_)).parts[1]
@@ -68,39 +105,206 @@ class OSTools:
                     ...
                 else:
                     current_output = current_output.joinpath(*current.parts[1:])
-                self.manager.dispatch("on_before_build_directory", current, current_output)
                 # ファイルのパスを返す。
+                paths = []
                 for raw_path in raw_paths:
-                    yield current.joinpath(raw_path), current_output
-                self.manager.dispatch("on_after_build_directory", current, current_output)
+                    path = current.joinpath(raw_path)
+                    if shard_count <= 1 \
+                            or shard_of(path, shard_count) == self.manager.config.shard_index:
+                        paths.append(path)
+                yield current, current_output, paths
+
+    def stat(self, path: PurePath | str) -> stat_result:
+        """This is :func:`os.stat` which uses :attr:`Manager.snapshot` while :meth:`Manager.build_all` is running.
+
+        Args:
+            path: The path to the file.
+
+        Raises:
+            FileNotFoundError: The file does not exist."""
+        if self.manager.snapshot is not None:
+            return self.manager.snapshot.stat(path)
+        return stat(path)
+
+    def exists(self, path: PurePath | str) -> bool:
+        """This is :func:`os.path.exists` which uses :attr:`Manager.snapshot` while :meth:`Manager.build_all` is running.
+
+        Args:
+            path: The path."""
+        if self.manager.snapshot is not None:
+            return self.manager.snapshot.exists(path)
+        return exists(path)
+
+    def _in_memory(self, path: PurePath) -> bool:
+        # メモリ上に出力先があるかどうかを調べる。
+        return self.manager.memory_outputs is not None \
+            and bool(path.parts) and path.parts[0] == self.manager.config.output_folder
 
     def mkdir_if_not_exists(self, path: PurePath | None) -> None:
         """If there is no folder with the specified path, create one.
+        If :attr:`.config.Config.in_memory` is enabled, nothing is done for folders in the output folder.
 
         Args:
             path: The path."""
-        if path is not None:
-            if not exists(path):
-                mkdir(path)
+        if path is not None and not self._in_memory(path):
+            if not self.exists(path):
+                # ワーカープロセスでは、親のフォルダのページより先にビルドすることがあるので、親のフォルダも作る。
+                if path.parent != path:
+                    self.mkdir_if_not_exists(path.parent)
+                try:
+                    mkdir(path)
+                except FileExistsError:
+                    # ワーカープロセス等で既に作られている場合がある。
+                    ...
+                if self.manager.snapshot is not None:
+                    self.manager.snapshot.add_directory(path)
+
+    def write_output(self, path: PurePath, data: str | bytes) -> bool:
+        """Write the data to the output file.
+        If the contents of the output file are the same as the data, nothing is written so that the last modified date is not changed.
+        It is judged by the digest stored in :attr:`.caches.Caches.output_digests`.
+        The data is written to a temporary file and then the output file is replaced with it, so a half-written file is never read.
+        If :attr:`.config.Config.in_memory` is enabled, the data is kept in :attr:`Manager.memory_outputs` instead.
+
+        Args:
+            path: The path to the output file.
+            data: The data.
+
+        Returns:
+            Whether the data was written."""
+        if isinstance(data, str):
+            data = data.encode()
+        if self._in_memory(path):
+            return self._write_memory_output(path, data)
+        if self._is_unchanged_output(path, new_digest := digest(data)):
+            return False
+        self._record_written_output(path, new_digest, _write_file(path, data))
+        return True
+
+    async def aiowrite_output(self, path: PurePath, data: str | bytes) -> bool:
+        """This is an asynchronous version of :meth:`.write_output`.
+        The file is written in the default executor of the event loop.
+
+        Args:
+            path: The path to the output file.
+            data: The data.
+
+        Returns:
+            Whether the data was written."""
+        if isinstance(data, str):
+            data = data.encode()
+        if self._in_memory(path):
+            return self._write_memory_output(path, data)
+        if self._is_unchanged_output(path, new_digest := digest(data)):
+            return False
+        from asyncio import get_running_loop
+        self._record_written_output(path, new_digest, await get_running_loop().run_in_executor(
+            None, _write_file, path, data
+        ))
+        return True
+
+    def _write_memory_output(self, path: PurePath, data: bytes) -> bool:
+        # メモリ上に出力する。
+        assert self.manager.memory_outputs is not None
+        if (file := self.manager.memory_outputs.get(raw_path := str(path))) is not None \
+                and file.source is None and file.data == data:
+            return False
+        self.manager.memory_outputs[raw_path] = MemoryFile(data, mtime=time())
+        return True
+
+    def _is_unchanged_output(self, path: PurePath, new_digest: str) -> bool:
+        # 前回書き込んだ時から出力先のファイルが変わっていない場合は、ダイジェストで中身を比べる。
+        if (cache := self.manager.caches.output_digests.get(str(path))) is not None \
+                and cache.digest == new_digest:
+            try:
+                result = self.stat(path)
+            except FileNotFoundError:
+                return False
+            return cache.stat == [result.st_size, result.st_mtime_ns, result.st_ino]
+        return False
+
+    def _record_written_output(self, path: PurePath, new_digest: str, result: stat_result) -> None:
+        # 書き込んだファイルのダイジェストを記録する。
+        self.manager.caches.output_digests[str(path)] = FileDigest(
+            stat=[result.st_size, result.st_mtime_ns, result.st_ino], digest=new_digest
+        )
+        if self.manager.snapshot is not None:
+            self.manager.snapshot.update(path, result)
+
+    def copy_output(self, source: PurePath, path: PurePath) -> None:
+        """Copy the file to the output file in the way of :attr:`.config.Config.include_sync`.
+        If :attr:`.config.Config.in_memory` is enabled, only the path to the source file is kept in :attr:`Manager.memory_outputs`.
+
+        Args:
+            source: The path to the file to be copied.
+            path: The path to the output file."""
+        if self._in_memory(path):
+            assert self.manager.memory_outputs is not None
+            self.manager.memory_outputs[str(path)] = MemoryFile(
+                source=str(source), mtime=stat(source).st_mtime
+            )
+        else:
+            sync_file(source, path, self.manager.config.include_sync)
+            if self.manager.snapshot is not None:
+                self.manager.snapshot.update(path)
+
+    def output_exists(self, path: PurePath) -> bool:
+        """Whether the output file exists.
+
+        Args:
+            path: The path to the output file."""
+        if self._in_memory(path):
+            assert self.manager.memory_outputs is not None
+            return str(path) in self.manager.memory_outputs
+        return self.exists(path)
+
+    def output_mtime(self, path: PurePath) -> float | None:
+        """Get the last modified date of the output file.
+        If the file does not exist, ``None`` is returned.
+
+        Args:
+            path: The path to the output file."""
+        if self._in_memory(path):
+            assert self.manager.memory_outputs is not None
+            file = self.manager.memory_outputs.get(str(path))
+            return None if file is None else file.mtime
+        try:
+            return self.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
 
     def remove(self, path: PurePath) -> None:
         """Deletes the file at the specified path and then attempts to delete the folder in which the file resided.
 
         Args:
             path: The path of the file."""
+        if self._in_memory(path):
+            assert self.manager.memory_outputs is not None
+            self.manager.memory_outputs.pop(str(path), None)
+            return
         remove(path)
+        if self.manager.snapshot is not None:
+            self.manager.snapshot.discard(path)
         try:
             rmdir(path.parent)
         except (FileNotFoundError, OSError):
             ...
+        else:
+            if self.manager.snapshot is not None:
+                self.manager.snapshot.discard(path.parent)
 
     def rmdir(self, path: PurePath) -> None:
         """Delete the directory.
 
         Args:
             path: The path of the directory."""
-        if exists(path):
+        if self._in_memory(path):
+            assert self.manager.memory_outputs is not None
+            self.manager.memory_outputs.remove_directory(path)
+        elif self.exists(path):
             rmtree(path)
+            if self.manager.snapshot is not None:
+                self.manager.snapshot.discard(path)
 
     def remove_local_folder_path(self, path: PurePath) -> PurePath:
         """Delete the local folder portion from the path passed.
@@ -112,6 +316,23 @@ class OSTools:
         return PurePath().joinpath(*path.parts[1:])
 
 
+def _write_file(path: PurePath, data: bytes) -> stat_result:
+    # 書き込み途中のファイルが読まれないように、一時ファイルに書き込んでから置き換える。
+    temporary = f"{path}.{getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(data)
+        replace(temporary, path)
+    except BaseException:
+        # 一時ファイルが出力結果として残らないように消す。
+        try:
+            remove(temporary)
+        except FileNotFoundError:
+            ...
+        raise
+    return stat(path)
+
+
 def enum(path: PurePath) -> Iterator[PurePath]:
     """Enumerates the paths to files in the specified directory.
 
@@ -155,13 +376,108 @@ class Bundle:
             et.remove_listener(value)
 
 
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+def _stable_repr(value: Any) -> str:
+    # 集合の順番やオブジェクトのアドレスはプロセスごとに変わるので、含めないようにする。
+    # ダイジェストはキャッシュに保存されて次のビルドと比べられるので、プロセスが変わっても同じになる必要がある。
+    if isinstance(value, set | frozenset):
+        return f"{type(value).__name__}({sorted(map(_stable_repr, value))})"
+    return _ADDRESS.sub("", repr(value))
+
+
+def _fingerprint_code(code: CodeType) -> tuple[Any, ...]:
+    # 行番号等は含めずに、処理の内容だけを取り出す。
+    return (code.co_code, code.co_names, code.co_varnames, tuple(
+        _fingerprint_code(const) if isinstance(const, CodeType) else _stable_repr(const)
+        for const in code.co_consts
+    ))
+
+
+def _fingerprint(value: Any, root: str, seen: set[int]) -> Any:
+    # 値の中身を表すものを作る。`root`のパッケージで定義されたものは中身まで辿る。
+    if id(value) in seen:
+        return "..."
+    if isinstance(value, EventTool):
+        # Managerはエクステンションを読み込み直しても同じものが使われる。
+        return "<manager>"
+    seen.add(id(value))
+    if isinstance(value, MethodType):
+        return (_fingerprint(value.__func__, root, seen), _fingerprint(value.__self__, root, seen))
+    module = getattr(value, "__module__", None) if not isinstance(value, ModuleType) \
+        else value.__name__
+    if not isinstance(module, str) or (module != root and not module.startswith(f"{root}.")):
+        if isinstance(value, FunctionType | type | ModuleType):
+            return f"{module}.{getattr(value, '__qualname__', '')}"
+        return _stable_repr(value)
+    if isinstance(value, FunctionType):
+        closure = []
+        for cell in value.__closure__ or ():
+            try:
+                closure.append(_fingerprint(cell.cell_contents, root, seen))
+            except ValueError:
+                closure.append(None)
+        return (
+            _fingerprint_code(value.__code__), _stable_repr(value.__defaults__), tuple(closure),
+            tuple(
+                _fingerprint(value.__globals__[name], root, seen)
+                for name in value.__code__.co_names if name in value.__globals__
+            )
+        )
+    if isinstance(value, type | ModuleType):
+        return (module, getattr(value, "__qualname__", ""), tuple(
+            (name, _fingerprint(item, root, seen)) for name, item in vars(value).items()
+            if not name.startswith("__")
+        ), tuple(map(repr, getattr(value, "__bases__", ()))))
+    if hasattr(value, "__dict__"):
+        return (_fingerprint(type(value), root, seen), tuple(
+            (name, _fingerprint(item, root, seen)) for name, item in vars(value).items()
+        ))
+    return (_fingerprint(type(value), root, seen), _stable_repr(value))
+
+
+def fingerprint(value: Any) -> str:
+    """Make the digest of the code of the function or the class.
+    The functions, the classes and the values used by it are also included if they are in the same package.
+    It is used to know whether an event listener was changed when extensions are reloaded or since the last build.
+    The digest does not depend on the process, so the order of sets and the addresses in ``repr`` of values are not included.
+
+    Args:
+        value: The function or the class."""
+    module = getattr(value.__func__ if isinstance(value, MethodType) else value, "__module__", "")
+    return digest(repr(_fingerprint(value, str(module).partition(".")[0], set())))
+
+
 class EventTool:
-    "Class for managing events."
+    """Class for managing events.
+    The event listeners and the bundles added while an extension is loaded by :meth:`Manager.load_extension` are recorded as ones of the extension,
+    so they are removed when the extension is unloaded."""
 
     def __init__(self, manager: Manager):
         self.manager = manager
         self.listeners = defaultdict[str, list[Callable]](list)
         self.bundles = Context[Bundle]()
+        self._extension: str | None = None
+        self._extension_listeners = defaultdict[str, list[tuple[str, Callable]]](list)
+        self._extension_bundles = defaultdict[str, list[Bundle]](list)
+
+    def _remove_extension_listeners(self, name: str) -> None:
+        # エクステンションで追加されたイベントリスナーとバンドルを消す。
+        for bundle in self._extension_bundles.pop(name, ()):
+            if self.bundles.get(bundle.__class__.__name__) is bundle:
+                self.remove_bundle(bundle)
+        for event_name, listener in self._extension_listeners.pop(name, ()):
+            if listener in self.listeners.get(event_name, ()):
+                self.listeners[event_name].remove(listener)
+
+    def digest_listeners(self, event_names: Iterable[str]) -> str:
+        """Make the digest of the code of the event listeners with :func:`fingerprint`.
+
+        Args:
+            event_names: The names of the events."""
+        return digest("\0".join(
+            f"{event_name}:{','.join(map(fingerprint, self.listeners.get(event_name, ())))}"
+            for event_name in event_names
+        ))
 
     def add_bundle(self, bundle: Bundle) -> None:
         """Add the event listeners in the instance of the bundle passed.
@@ -170,6 +486,8 @@ class EventTool:
             bundle: The bundle."""
         self.bundles[bundle.__class__.__name__] = bundle
         self.bundles[bundle.__class__.__name__]._prepare(self)
+        if self._extension is not None:
+            self._extension_bundles[self._extension].append(bundle)
 
     def remove_bundle(self, bundle: Bundle) -> None:
         """Remove the event listeners from the :class:`EventTool` in the instance of the passed bundle.
@@ -187,6 +505,8 @@ class EventTool:
             name: The name of the event.
                 If ``None``, the function name is used."""
         self.listeners[name or listener.__name__].append(listener)
+        if self._extension is not None:
+            self._extension_listeners[self._extension].append((name or listener.__name__, listener))
 
     def remove_listener(self, target: Callable | str) -> None:
         """Delete event listener.
@@ -228,7 +548,41 @@ class EventTool:
             **kwargs: Keyword arguments to be passed to event listeners."""
         return_values: list[Any] | None = [] if collect_return_value else None
         for listener in self.listeners[event_name]:
-            result = listener(*args, **kwargs)
+            if self.manager.tracer.enabled:
+                with self.manager.tracer.span(
+                    getattr(listener, "__qualname__", repr(listener)),
+                    "listener", event=event_name
+                ):
+                    result = listener(*args, **kwargs)
+            else:
+                result = listener(*args, **kwargs)
+            if collect_return_value:
+                return_values.append(result) # type: ignore
+        return return_values or ()
+
+    async def aiodispatch(
+        self, event_name: str, /, *args: Any,
+        collect_return_value: bool = False,
+        **kwargs: Any
+    ) -> Sequence[Any]:
+        """This is an asynchronous version of :meth:`.dispatch`.
+        If an event listener is a coroutine function (or returns an awaitable), it is awaited.
+        This is used instead of :meth:`.dispatch` for the events of pages when :attr:`.config.Config.async_build` is enabled.
+
+        Args:
+            event_name: The name of the event.
+            *args: Arguments to be passed to event listeners.
+            collect_return_value: Whether to collect the return value of the event listener.
+            **kwargs: Keyword arguments to be passed to event listeners."""
+        return_values: list[Any] | None = [] if collect_return_value else None
+        for listener in self.listeners[event_name]:
+            with self.manager.tracer.span(
+                getattr(listener, "__qualname__", repr(listener)),
+                "listener", event=event_name
+            ):
+                result = listener(*args, **kwargs)
+                if isawaitable(result):
+                    result = await result
             if collect_return_value:
                 return_values.append(result) # type: ignore
         return return_values or ()
\ No newline at end of file
@@ -0,0 +1,110 @@
+# nisshi - Tracing
+
+from __future__ import annotations
+
+from typing import Any
+from collections.abc import Iterable
+
+from contextlib import nullcontext
+from collections import defaultdict
+
+from threading import get_ident
+from time import perf_counter_ns
+from os import getpid
+
+from .json import dumps
+
+
+__all__ = ("Tracer", "Span")
+
+
+class Span:
+    "Context manager which records the time spent in it to :class:`Tracer`."
+
+    def __init__(self, tracer: Tracer, name: str, category: str, args: dict[str, Any]):
+        self.tracer, self.name, self.category, self.args = tracer, name, category, args
+
+    def __enter__(self) -> Span:
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.tracer.events.append({
+            "name": self.name, "cat": self.category, "ph": "X",
+            "ts": self.start / 1000, "dur": (perf_counter_ns() - self.start) / 1000,
+            "pid": getpid(), "tid": get_ident(), "args": self.args
+        })
+
+
+_NULL = nullcontext()
+class Tracer:
+    """Class for recording how long each phase of a build takes.
+    The records can be exported as JSON in the Chrome trace event format, which can be opened with Perfetto or ``chrome://tracing``.
+
+    Args:
+        enabled: Whether to record. If this is ``False``, :meth:`.span` does nothing."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events: list[dict[str, Any]] = []
+
+    def span(self, name: str, category: str = "build", **args: Any) -> Span | nullcontext:
+        """Make a context manager which records the time spent in it.
+
+        Args:
+            name: The name of the span.
+            category: The category of the span.
+                ``file`` is used for processing each file and ``listener`` is used for each event listener.
+            **args: Extra information of the span."""
+        if not self.enabled:
+            return _NULL
+        return Span(self, name, category, args)
+
+    def take(self) -> list[dict[str, Any]]:
+        "Take out the recorded events. This is used to send them from worker processes."
+        events, self.events = self.events, []
+        return events
+
+    def merge(self, events: Iterable[dict[str, Any]]) -> None:
+        """Add events recorded by other tracers.
+
+        Args:
+            events: The events."""
+        self.events.extend(events)
+
+    def export(self, path: str) -> None:
+        """Write the recorded events as Chrome trace JSON.
+
+        Args:
+            path: The path to the file."""
+        with open(path, "w") as f:
+            f.write(dumps({"traceEvents": self.events, "displayTimeUnit": "ms"}))
+
+    def report(self, top: int = 10) -> str:
+        """Make a report of the slowest files and event listeners.
+
+        Args:
+            top: The number of entries of each ranking."""
+        files = sorted(
+            (event for event in self.events if event["cat"] == "file"),
+            key=lambda event: event["dur"], reverse=True
+        )[:top]
+        listeners: defaultdict[str, list[float]] = defaultdict(lambda: [0.0, 0])
+        for event in self.events:
+            if event["cat"] == "listener":
+                listeners[event["name"]][0] += event["dur"]
+                listeners[event["name"]][1] += 1
+
+        lines = [f"Top {top} slowest files:"]
+        lines.extend(
+            "  {:>10.3f}ms  {}".format(event["dur"] / 1000, event["name"])
+            for event in files
+        )
+        lines.append(f"Top {top} slowest event listeners:")
+        lines.extend(
+            "  {:>10.3f}ms  {} ({} calls)".format(total / 1000, name, count)
+            for name, (total, count) in sorted(
+                listeners.items(), key=lambda item: item[1][0], reverse=True
+            )[:top]
+        )
+        return "\n".join(lines)
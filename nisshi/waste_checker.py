@@ -3,11 +3,10 @@
 from __future__ import annotations
 
 from pathlib import PurePath
-from os.path import exists
-from os import stat
 
 from .manager import Manager, _replace_cls
-from .caches import OutputMetadata
+from .caches import OutputMetadata, FileDigest
+from .hashing import file_digest
 
 
 __all__ = ("WasteChecker",)
@@ -18,6 +17,7 @@ class WasteChecker:
     """A waste checker that implements a function to check if a build is not wasteful.
     The mechanism implemented in this class is to check if the last modified date of the already built file is the same as that of the file to be built, when the file has already been built at build time.
     For layout files, where the file to build to is a nonexistent file, the last-modified date is stored in the cache instead.
+    If :attr:`.config.Config.hash_check` is enabled, the digest of the contents stored in the cache is compared instead of the last modified date.
 
     Args:
         force_cache: Whether to write the last modified date of all files to the cache for processing."""
@@ -25,13 +25,40 @@ class WasteChecker:
     def __init__(self, manager: Manager, force_cache: bool = False) -> None:
         self.force_cache, self.manager = force_cache, manager
 
+    def _update_digest(self, path: PurePath) -> bool | None:
+        """Update the digest of the file in the cache.
+        Returns ``None`` if the contents have not been changed, ``True`` if they have been changed and ``False`` if the file is new."""
+        result = self.manager.stat(path)
+        key = [result.st_size, result.st_mtime_ns, result.st_ino]
+        if (raw_path := str(path)) in self.manager.caches.digests:
+            cache = self.manager.caches.digests[raw_path]
+            if cache.stat == key:
+                return None
+            # 日付等が変わった場合のみ、中身を確認する。
+            cache.stat, digest = key, file_digest(path)
+            if cache.digest == digest:
+                return None
+            cache.digest = digest
+            return True
+        self.manager.caches.digests[raw_path] = FileDigest(
+            stat=key, digest=file_digest(path)
+        )
+        return False
+
     def judge(self, path: PurePath, output_path: PurePath | None, force: bool = False) -> bool | None:
         if self.manager.config.force_build:
-            if output_path is not None and exists(output_path):
+            if output_path is not None and self.manager.output_exists(output_path):
                 return True
+        elif self.manager.config.hash_check:
+            state = self._update_digest(path)
+            if output_path is None:
+                return True if force and state is None else state
+            if self.manager.output_exists(output_path):
+                return None if state is None and not force else True
         else:
-            last_update = stat(path).st_mtime
-            if path.parents[-2].name == self.manager.config.layout_folder or self.force_cache:
+            last_update = self.manager.stat(path).st_mtime
+            if output_path is None or self.force_cache \
+                    or path.parents[-2].name == self.manager.config.layout_folder:
                 if (raw_path := str(path)) in self.manager.caches.outputs:
                     if self.manager.caches.outputs[raw_path].last_update >= last_update \
                             and not force:
@@ -42,8 +69,13 @@ class WasteChecker:
                     last_update=last_update, output_path=output_path
                 )
             else:
-                if output_path is not None and exists(output_path):
-                    if stat(output_path).st_mtime >= last_update and not force:
+                if output_path is not None \
+                        and (output_mtime := self.manager.output_mtime(output_path)) is not None:
+                    if not force and (output_mtime >= last_update or (
+                        # 中身が同じで書き込まれなかった場合は、記録された入力元の更新日時と比べる。
+                        (cache := self.manager.caches.outputs.get(str(path))) is not None
+                        and cache.last_update >= last_update
+                    )):
                         return None
                     return True
 